@@ -1,65 +1,575 @@
+import atexit
+import gzip
 import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
 from pathlib import Path
-from typing import Generator
+from queue import Queue, Empty
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional
 
 from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Session, SQLModel
 
 from .models import (
-    User, UserSession, Campaign, Contact, CampaignContact,
-    EmailTemplate, SendWave, MailLog, AuditLog
+    User, UserSession, Campaign, Contact, CampaignContact, IndexedAttribute,
+    EmailTemplate, SendWave, MailLog, SendOutbox, AuditLog, StatsRollup
 )
+from .migrations import run_migrations
 
 logger = logging.getLogger(__name__)
 
+# Lookup tables small enough that a full scan is expected
+SMALL_TABLES = frozenset({
+    "users", "user_sessions", "campaigns", "email_templates", "send_waves",
+    "stats_rollups", "indexed_attributes", "sqlite_master"
+})
+
+# EXPLAIN QUERY PLAN step reading a whole table or index, e.g. "SCAN contacts"
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! VIRTUAL TABLE)")
+
+# Connection settings per role, overridden by the "database.pragmas" section
+# of config.yaml. bulk_import is applied to the writer while an import batch
+# is written, on top of the writer settings.
+DEFAULT_PRAGMA_PROFILES = {
+    "reader": {
+        "cache_size_kib": 65536,
+        "mmap_size": 268435456,
+        "busy_timeout": 30000,
+        "temp_store": "MEMORY",
+    },
+    "writer": {
+        "cache_size_kib": 16384,
+        "mmap_size": 268435456,
+        "busy_timeout": 30000,
+        "temp_store": "MEMORY",
+        "synchronous": "NORMAL",
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 67108864,
+    },
+    "bulk_import": {
+        "cache_size_kib": 262144,
+        "synchronous": "OFF",
+        "wal_autocheckpoint": 10000,
+    },
+}
+
+PRAGMA_KEYWORDS = {
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+
+# Values of PRAGMA auto_vacuum
+AUTO_VACUUM_MODES = ("NONE", "FULL", "INCREMENTAL")
+
+
+class _Handover:
+    """Request for exclusive use of the writer session by another thread."""
+    
+    def __init__(self):
+        self.granted = threading.Event()
+        self.released = threading.Event()
+
+
+class DatabaseWriter:
+    """Single thread through which every write to the database goes.
+    
+    Jobs submitted with ``submit`` are group-committed: the thread drains
+    the queue into one transaction, each job in its own SAVEPOINT so a
+    failing job only undoes itself. ``acquire`` hands the writer session
+    to the calling thread for a synchronous unit of work, between groups.
+    ``profile`` names the PRAGMA profile the next transaction runs with.
+    """
+    
+    def __init__(self, engine: Engine, max_group_size: int = 200):
+        self.engine = engine
+        self.max_group_size = max_group_size
+        self.session = Session(engine, expire_on_commit=False)
+        self.profile = "writer"
+        
+        # When the application last wrote, for spotting idle windows
+        self.last_write = time.monotonic()
+        
+        self._jobs: Queue = Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        
+        # Commit what is still queued when the application exits
+        atexit.register(self.stop)
+        
+    @property
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+        
+    def submit(self, job: Callable[[Session], Any]) -> Future:
+        """Queue ``job(session)``; the future resolves once its group is committed."""
+        future = Future()
+        self._put((job, future))
+        return future
+        
+    @contextmanager
+    def acquire(self) -> Iterator[Session]:
+        """Wait for the writer to finish its current group, then lend its session."""
+        handover = _Handover()
+        self._put(handover)
+        handover.granted.wait()
+        try:
+            yield self.session
+        finally:
+            handover.released.set()
+            
+    def stop(self, timeout: float = 10.0):
+        """Commit the jobs already queued and stop the thread."""
+        if self._thread and self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join(timeout)
+            
+    def _put(self, item):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+                self._thread.start()
+        self._jobs.put(item)
+        
+    def _run(self):
+        pending = None
+        while True:
+            item = pending if pending is not None else self._jobs.get()
+            pending = None
+            if item is None:
+                break
+                
+            if isinstance(item, _Handover):
+                item.granted.set()
+                item.released.wait()
+                continue
+                
+            # Group every job already waiting, up to the next handover
+            group = [item]
+            while len(group) < self.max_group_size:
+                try:
+                    item = self._jobs.get_nowait()
+                except Empty:
+                    break
+                if item is None or isinstance(item, _Handover):
+                    pending = item
+                    break
+                group.append(item)
+                
+            self._commit_group(group)
+            
+        # Jobs queued after the stop request
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, tuple):
+                self._commit_group([item])
+            elif isinstance(item, _Handover):
+                item.granted.set()
+                item.released.wait()
+                
+    def _commit_group(self, group: List[tuple]):
+        session = self.session
+        outcomes = []
+        try:
+            for job, future in group:
+                try:
+                    with session.begin_nested():
+                        outcomes.append((future, job(session), None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Write group of {len(group)} jobs failed: {e}")
+            outcomes = [(future, None, e) for _, future in group]
+        finally:
+            session.close()
+            self.last_write = time.monotonic()
+            
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class DatabaseMaintenance:
+    """Background upkeep of the database file.
+    
+    Every ``interval`` seconds the WAL is checkpointed: PASSIVE while the
+    application is writing, TRUNCATE in idle windows, when nothing has been
+    written for ``idle_seconds``. Idle windows also return free pages to the
+    filesystem with incremental_vacuum, ``vacuum_pages`` at a time, once at
+    least ``vacuum_min_free_pages`` are free. ``stop`` runs PRAGMA optimize.
+    """
+    
+    def __init__(self, database: "Database"):
+        self.database = database
+        self.enabled = True
+        self.interval = 60.0
+        self.idle_seconds = 30.0
+        self.vacuum_pages = 2000
+        self.vacuum_min_free_pages = 1000
+        
+        # Outcome of the latest passes, reported by metrics()
+        self.last_run_at: Optional[datetime] = None
+        self.last_checkpoint: Optional[Dict[str, Any]] = None
+        self.pages_vacuumed = 0
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+    def configure(self, settings: Dict[str, Any]):
+        """Apply the "database.maintenance" section of config.yaml."""
+        self.enabled = settings.get("enabled", self.enabled)
+        self.interval = settings.get("interval_seconds", self.interval)
+        self.idle_seconds = settings.get("idle_seconds", self.idle_seconds)
+        self.vacuum_pages = settings.get("vacuum_pages", self.vacuum_pages)
+        self.vacuum_min_free_pages = settings.get("vacuum_min_free_pages", self.vacuum_min_free_pages)
+        
+    @property
+    def is_idle(self) -> bool:
+        return time.monotonic() - self.database.writer.last_write >= self.idle_seconds
+        
+    def start(self):
+        """Start the maintenance thread, if enabled and not already running."""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+            
+        if self.database.get_storage_metrics()["auto_vacuum"] != "INCREMENTAL":
+            logger.info("Incremental vacuum is off for this database; vacuum_database() turns it on")
+            
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="database-maintenance", daemon=True)
+        self._thread.start()
+        
+        # Optimize before the writer thread is stopped at exit
+        atexit.register(self.stop)
+        
+    def stop(self, timeout: float = 30.0):
+        """Stop the maintenance thread and run PRAGMA optimize."""
+        if self._thread is None:
+            return
+            
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        try:
+            self.database.optimize()
+        except Exception as e:
+            logger.error(f"Database optimize failed: {e}")
+            
+    def run_once(self) -> Dict[str, Any]:
+        """Run one maintenance pass and return the metrics it started from."""
+        metrics = self.database.get_storage_metrics()
+        
+        free_pages = metrics["free_pages"]
+        if metrics["auto_vacuum"] == "INCREMENTAL" and free_pages >= self.vacuum_min_free_pages:
+            while free_pages > 0 and self.is_idle and not self._stop.is_set():
+                freed = self.database.incremental_vacuum(self.vacuum_pages)
+                if not freed:
+                    break
+                free_pages -= freed
+                self.pages_vacuumed += freed
+                
+        mode = "TRUNCATE" if self.is_idle else "PASSIVE"
+        self.last_checkpoint = {"mode": mode, **self.database.checkpoint(mode)}
+        self.last_run_at = datetime.utcnow()
+        return metrics
+        
+    def metrics(self) -> Dict[str, Any]:
+        """Current storage metrics and the outcome of the latest passes."""
+        return {
+            **self.database.get_storage_metrics(),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_checkpoint": self.last_checkpoint,
+            "pages_vacuumed": self.pages_vacuumed
+        }
+        
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Database maintenance failed: {e}")
+
 
 class Database:
-    """Database manager for SQLite operations."""
+    """Database manager for SQLite operations.
+    
+    Writes are serialized through one writer connection (``write_scope`` and
+    ``submit_write``); reads use a separate pool of query_only connections
+    (``session_scope``), which WAL lets run alongside the writer.
+    """
     
     def __init__(self, database_url: str = "sqlite:///./data.db"):
         self.database_url = database_url
+        self.pragma_profiles = _pragma_profiles()
+        # busy_timeout comes from the PRAGMA profiles
+        connect_args = {
+            "check_same_thread": False,  # Allow multiple threads
+        }
+        
+        # Writer: migrations, the writer thread and maintenance
         self.engine = create_engine(
             database_url,
             echo=False,  # Set to True for SQL debugging
-            connect_args={
-                "check_same_thread": False,  # Allow multiple threads
-                "timeout": 30,  # 30 seconds timeout
-            }
+            poolclass=QueuePool,
+            pool_size=2,
+            max_overflow=2,
+            pool_pre_ping=True,
+            connect_args=connect_args
         )
         
+        # Readers: sized for the send workers, the result writer, wave feeders and the UI thread
+        self.read_engine = create_engine(
+            database_url,
+            echo=False,
+            poolclass=QueuePool,
+            pool_size=8,
+            max_overflow=4,
+            pool_timeout=30,
+            # Reuse the most recent connection, whose page cache is warm
+            pool_use_lifo=True,
+            pool_pre_ping=True,
+            connect_args=connect_args
+        )
+        
+        # Per-thread reader session reused by session_scope
+        self._local = threading.local()
+        
+        self.writer = DatabaseWriter(self.engine)
+        self.maintenance = DatabaseMaintenance(self)
+        
+        # Online backups
+        self.backup_enabled = True
+        self.backup_dir = Path(self.database_path).parent / "backups"
+        self.backup_retention_days = 30
+        self.backup_compress = False
+        self.backup_pages_per_step = 1024
+        self.backup_step_sleep = 0.01  # seconds between steps
+        
         # Enable WAL mode and other optimizations
         self._configure_sqlite()
         
+    def configure(self, database_config: Dict[str, Any]) -> None:
+        """Apply the "database" section of config.yaml.
+        
+        Settings under "pragmas" override the default profiles key by key.
+        Pooled connections are discarded so that new ones pick them up.
+        """
+        self.pragma_profiles = _pragma_profiles(database_config.get("pragmas"))
+        self.engine.dispose()
+        self.read_engine.dispose()
+        
+        self.backup_enabled = database_config.get("backup_enabled", self.backup_enabled)
+        self.backup_dir = Path(database_config.get("backup_dir", self.backup_dir))
+        self.backup_retention_days = database_config.get("backup_retention_days", self.backup_retention_days)
+        self.backup_compress = database_config.get("backup_compress", self.backup_compress)
+        self.backup_pages_per_step = database_config.get("backup_pages_per_step", self.backup_pages_per_step)
+        self.backup_step_sleep = database_config.get("backup_step_sleep_ms", self.backup_step_sleep * 1000) / 1000
+        
+        self.maintenance.configure(database_config.get("maintenance", {}))
+        
+    @property
+    def database_path(self) -> str:
+        """Filesystem path of the SQLite database file."""
+        return self.database_url.replace("sqlite:///", "")
+        
     def _configure_sqlite(self) -> None:
-        """Configure SQLite for optimal performance."""
-        
-        @event.listens_for(Engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            if 'sqlite' in str(dbapi_connection):
-                cursor = dbapi_connection.cursor()
-                # Enable WAL mode for better concurrency
-                cursor.execute("PRAGMA journal_mode=WAL")
-                # Enable foreign key constraints
-                cursor.execute("PRAGMA foreign_keys=ON")
-                # Optimize for speed
-                cursor.execute("PRAGMA synchronous=NORMAL")
-                cursor.execute("PRAGMA cache_size=10000")
-                cursor.execute("PRAGMA temp_store=MEMORY")
-                cursor.close()
-                
+        """Configure SQLite for optimal performance.
+        
+        Listeners are attached to this database's engines only. Each
+        connection gets the PRAGMA profile of its role when it is opened.
+        """
+        
+        def set_sqlite_pragma(dbapi_connection, profile: str):
+            cursor = dbapi_connection.cursor()
+            # Enable WAL mode for better concurrency
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Enable foreign key constraints
+            cursor.execute("PRAGMA foreign_keys=ON")
+            for statement in self.pragma_profiles[profile]:
+                cursor.execute(statement)
+            cursor.close()
+            
+        @event.listens_for(self.engine, "connect")
+        def set_writer_pragma(dbapi_connection, connection_record):
+            set_sqlite_pragma(dbapi_connection, "writer")
+            connection_record.info["pragma_profile"] = "writer"
+            # Transactions are begun below instead of by the driver, so that
+            # SAVEPOINTs work and the write lock is taken up front
+            dbapi_connection.isolation_level = None
+            
+        @event.listens_for(self.engine, "begin")
+        def begin_immediate(connection):
+            # synchronous cannot be changed inside a transaction, so the
+            # profile is switched right before the next one begins
+            profile = self.writer.profile
+            if connection.info.get("pragma_profile") != profile:
+                for statement in self.pragma_profiles[profile]:
+                    connection.exec_driver_sql(statement)
+                connection.info["pragma_profile"] = profile
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            
+        @event.listens_for(self.read_engine, "connect")
+        def set_reader_pragma(dbapi_connection, connection_record):
+            set_sqlite_pragma(dbapi_connection, "reader")
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+            
     def create_tables(self) -> None:
-        """Create all database tables."""
+        """Create all database tables and apply pending migrations."""
         try:
+            self._enable_incremental_vacuum()
             SQLModel.metadata.create_all(self.engine)
+            run_migrations(self.engine)
             logger.info("Database tables created successfully")
         except Exception as e:
             logger.error(f"Failed to create database tables: {e}")
             raise
             
+    @contextmanager
+    def record_queries(self) -> Iterator[Dict[str, Any]]:
+        """Collect the distinct statements run on the engine inside the block.
+        
+        Yields a dict filled with statement -> parameters of its first
+        execution, for ``find_full_scans``.
+        """
+        queries: Dict[str, Any] = {}
+        lock = threading.Lock()
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            with lock:
+                queries.setdefault(statement, parameters)
+                
+        for engine in (self.engine, self.read_engine):
+            event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield queries
+        finally:
+            for engine in (self.engine, self.read_engine):
+                event.remove(engine, "before_cursor_execute", record)
+                
+    def explain_query_plan(self, statement: str, parameters: Any = ()) -> List[str]:
+        """Get the steps of SQLite's query plan for a statement."""
+        with self.read_engine.connect() as connection:
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        return [row[-1] for row in rows]
+        
+    def find_full_scans(self, queries: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Plan steps that scan a whole table other than SMALL_TABLES, by statement.
+        
+        Only reads and UPDATE/DELETE statements are explained; an empty result
+        means every one of them is served by an index.
+        """
+        full_scans = {}
+        for statement, parameters in queries.items():
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+                continue
+                
+            steps = [
+                step for step in self.explain_query_plan(statement, parameters)
+                if (match := FULL_SCAN_PATTERN.match(step)) and match.group(1) not in SMALL_TABLES
+            ]
+            if steps:
+                full_scans[statement] = steps
+        return full_scans
+        
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """Read-only unit of work on this thread's reader session.
+        
+        The session is closed when the outermost scope exits, which releases
+        its connection and detaches loaded objects, and kept for the thread's
+        next scope. Nested scopes, and scopes inside a write_scope, join the
+        enclosing session.
+        """
+        active = self._active_session()
+        if active is not None:
+            yield active
+            return
+            
+        local = self._local
+        session = getattr(local, "reader", None)
+        if session is None:
+            # Objects returned by services stay readable once detached
+            session = local.reader = Session(self.read_engine, expire_on_commit=False)
+            
+        local.active = session
+        try:
+            yield session
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Database session error: {e}")
+            raise
+        finally:
+            local.active = None
+            session.close()
+            
+    @contextmanager
+    def write_scope(self, profile: str = "writer") -> Iterator[Session]:
+        """Unit of work on the writer session, serialized with every other write.
+        
+        Waits for the writer thread to hand its session over, commits on exit
+        and rolls back on error. Commits do not expire objects. Nested scopes
+        join the enclosing write. ``profile`` picks the PRAGMA profile of the
+        transaction, e.g. "bulk_import" for import batches.
+        """
+        if profile not in self.pragma_profiles:
+            raise ValueError(f"Unknown PRAGMA profile: {profile}")
+            
+        local = self._local
+        if getattr(local, "writing", False) or self.writer.is_writer_thread:
+            yield self.writer.session
+            return
+            
+        outer = getattr(local, "active", None)
+        with self.writer.acquire() as session:
+            local.writing = True
+            local.active = session
+            self.writer.profile = profile
+            try:
+                yield session
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Database write error: {e}")
+                raise
+            finally:
+                session.close()
+                self.writer.profile = "writer"
+                self.writer.last_write = time.monotonic()
+                local.writing = False
+                local.active = outer
+                
+    def submit_write(self, job: Callable[[Session], Any]) -> Future:
+        """Queue a write job for the next group commit of the writer thread."""
+        return self.writer.submit(job)
+        
+    def _active_session(self) -> Optional[Session]:
+        if self.writer.is_writer_thread:
+            return self.writer.session
+        return getattr(self._local, "active", None)
+        
     def get_session(self) -> Generator[Session, None, None]:
-        """Get database session with automatic cleanup."""
-        session = Session(self.engine)
+        """Get a new read-only database session with automatic cleanup."""
+        session = Session(self.read_engine)
         try:
             yield session
         except Exception as e:
@@ -69,40 +579,245 @@ class Database:
         finally:
             session.close()
             
-    def backup_database(self, backup_path: str) -> bool:
-        """Create a backup of the database."""
+    def backup_database(self, backup_path: str = None, compress: bool = None,
+                        progress_callback: Callable[[int, int], None] = None) -> Optional[str]:
+        """Back up the live database with the SQLite online backup API.
+        
+        Pages are copied backup_pages_per_step at a time with a pause after
+        each step, so the application keeps serving meanwhile.
+        ``progress_callback`` is called with the pages copied and the total.
+        Backups go to backup_dir by default, gzipped if ``compress`` (default
+        backup_compress), and those older than backup_retention_days are
+        pruned afterwards. Returns the backup path, or None if backups are
+        disabled or the backup failed.
+        """
+        if not self.backup_enabled:
+            logger.warning("Database backup skipped: backups are disabled")
+            return None
+            
+        if compress is None:
+            compress = self.backup_compress
+        if backup_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = str(self.backup_dir / f"{Path(self.database_path).stem}_{timestamp}.db")
+            if compress:
+                backup_path += ".gz"
+                
+        # Copied next to the target first, so a failed backup leaves no partial file
+        part_path = Path(f"{backup_path}.part")
         try:
-            import shutil
-            source_path = self.database_url.replace("sqlite:///", "")
-            shutil.copy2(source_path, backup_path)
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            part_path.unlink(missing_ok=True)
+            self._copy_snapshot(part_path, progress_callback)
+            
+            if compress:
+                with open(part_path, "rb") as source, gzip.open(backup_path, "wb") as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+            else:
+                os.replace(part_path, backup_path)
+                
             logger.info(f"Database backed up to {backup_path}")
-            return True
         except Exception as e:
             logger.error(f"Database backup failed: {e}")
-            return False
+            return None
+        finally:
+            part_path.unlink(missing_ok=True)
             
+        self.prune_backups()
+        return backup_path
+        
+    def _copy_snapshot(self, target_path: Path, progress_callback: Callable[[int, int], None] = None) -> None:
+        """Copy the database into a new file, a few pages per step."""
+        def progress(status, remaining, total):
+            if progress_callback:
+                try:
+                    progress_callback(total - remaining, total)
+                except Exception as e:
+                    logger.error(f"Progress callback error: {e}")
+            if remaining:
+                time.sleep(self.backup_step_sleep)
+                
+        connection = self.read_engine.raw_connection()
+        target = sqlite3.connect(target_path)
+        try:
+            source = connection.driver_connection
+            # Every step reads the snapshot of this one read transaction,
+            # which WAL keeps from blocking the writer. Without it, each
+            # write by another connection restarts the copy from page one.
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            try:
+                source.backup(target, pages=self.backup_pages_per_step, progress=progress)
+            finally:
+                source.execute("COMMIT")
+        finally:
+            target.close()
+            connection.close()
+            
+    def prune_backups(self) -> int:
+        """Delete the backups in backup_dir older than backup_retention_days.
+        
+        Returns the number of backups deleted.
+        """
+        if not self.backup_dir.exists():
+            return 0
+            
+        cutoff = time.time() - self.backup_retention_days * 86400
+        removed = 0
+        for path in self.backup_dir.glob(f"{Path(self.database_path).stem}_*.db*"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+                
+        if removed:
+            logger.info(f"Pruned {removed} database backups older than {self.backup_retention_days} days")
+        return removed
+        
+
     def vacuum_database(self) -> bool:
-        """Vacuum the database to reclaim space."""
+        """Rebuild the database file with a full VACUUM to reclaim space.
+        
+        Writes wait for the whole rebuild; routine reclaiming is left to the
+        incremental vacuum of the maintenance scheduler. Databases created
+        before incremental vacuum are switched to it on the way.
+        """
         try:
-            with Session(self.engine) as session:
-                session.exec("VACUUM")
-                session.commit()
+            with self._maintenance_connection(exclusive=True) as connection:
+                connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.execute("VACUUM")
             logger.info("Database vacuumed successfully")
             return True
         except Exception as e:
             logger.error(f"Database vacuum failed: {e}")
             return False
             
+    def _enable_incremental_vacuum(self) -> None:
+        """Set auto_vacuum=INCREMENTAL on a new database.
+        
+        The mode only takes effect through a VACUUM, which is instant while
+        the database has no tables yet.
+        """
+        with self._maintenance_connection() as connection:
+            if connection.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+                connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.execute("VACUUM")
+                
+    def incremental_vacuum(self, pages: int) -> int:
+        """Return up to ``pages`` free pages to the filesystem.
+        
+        Returns the number of pages freed.
+        """
+        with self._maintenance_connection(exclusive=True) as connection:
+            before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            # One page is freed per result row, so the statement is run to the end
+            connection.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            after = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+        
+    def checkpoint(self, mode: str = "PASSIVE", busy_timeout: int = 1000) -> Dict[str, int]:
+        """Checkpoint the WAL into the database file.
+        
+        PASSIVE copies what it can without waiting. TRUNCATE also waits, up
+        to ``busy_timeout`` ms, for readers on older snapshots, then empties
+        the WAL file; the writer is held meanwhile. Returns SQLite's busy flag
+        and the WAL and checkpointed frame counts.
+        """
+        mode = mode.upper()
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"Unknown checkpoint mode: {mode}")
+            
+        with self._maintenance_connection(exclusive=mode != "PASSIVE") as connection:
+            previous_timeout = connection.execute("PRAGMA busy_timeout").fetchone()[0]
+            connection.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+            try:
+                busy, wal_frames, checkpointed = connection.execute(
+                    f"PRAGMA wal_checkpoint({mode})"
+                ).fetchone()
+            finally:
+                connection.execute(f"PRAGMA busy_timeout={previous_timeout}")
+                
+        return {"busy": busy, "wal_frames": wal_frames, "checkpointed_frames": checkpointed}
+        
+    def optimize(self) -> None:
+        """Run PRAGMA optimize, which refreshes planner statistics that went stale."""
+        with self._maintenance_connection(exclusive=True) as connection:
+            connection.execute("PRAGMA optimize")
+            
+    def get_storage_metrics(self) -> Dict[str, Any]:
+        """Sizes of the database file and its WAL, and the pages vacuum can free."""
+        with self.read_engine.connect() as connection:
+            page_size, page_count, free_pages, auto_vacuum = (
+                connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in ("page_size", "page_count", "freelist_count", "auto_vacuum")
+            )
+            
+        wal_path = Path(f"{self.database_path}-wal")
+        return {
+            "database_bytes": page_size * page_count,
+            "wal_bytes": wal_path.stat().st_size if wal_path.exists() else 0,
+            "free_pages": free_pages,
+            "free_bytes": page_size * free_pages,
+            "auto_vacuum": AUTO_VACUUM_MODES[auto_vacuum]
+        }
+        
+    @contextmanager
+    def _maintenance_connection(self, exclusive: bool = False) -> Iterator[sqlite3.Connection]:
+        """Raw writer connection in autocommit mode, for statements that cannot run in a transaction.
+        
+        With ``exclusive`` the writer is held, so application writes queue
+        behind the statement instead of waiting on SQLite's lock.
+        """
+        with self.writer.acquire() if exclusive else nullcontext():
+            connection = self.engine.raw_connection()
+            try:
+                yield connection.driver_connection
+            finally:
+                connection.close()
+                
+
     def get_database_size(self) -> int:
         """Get the database file size in bytes."""
         try:
-            db_path = self.database_url.replace("sqlite:///", "")
-            return Path(db_path).stat().st_size
+            return Path(self.database_path).stat().st_size
         except Exception as e:
             logger.error(f"Failed to get database size: {e}")
             return 0
 
 
+def _pragma_profiles(overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, List[str]]:
+    """Merge PRAGMA profile overrides into the defaults and render their statements."""
+    overrides = overrides or {}
+    unknown = set(overrides) - set(DEFAULT_PRAGMA_PROFILES)
+    if unknown:
+        raise ValueError(f"Unknown PRAGMA profiles: {', '.join(sorted(unknown))}")
+        
+    profiles = {
+        name: {**settings, **(overrides.get(name) or {})}
+        for name, settings in DEFAULT_PRAGMA_PROFILES.items()
+    }
+    profiles["bulk_import"] = {**profiles["writer"], **profiles["bulk_import"]}
+    return {name: _pragma_statements(settings) for name, settings in profiles.items()}
+
+
+def _pragma_statements(settings: Dict[str, Any]) -> List[str]:
+    """Render one profile's settings as PRAGMA statements."""
+    statements = []
+    for name, value in settings.items():
+        if name == "cache_size_kib":
+            # A negative cache_size is in KiB rather than pages
+            statements.append(f"PRAGMA cache_size=-{int(value)}")
+        elif name in ("mmap_size", "busy_timeout", "wal_autocheckpoint", "journal_size_limit"):
+            statements.append(f"PRAGMA {name}={int(value)}")
+        elif name in PRAGMA_KEYWORDS:
+            keyword = str(value).upper()
+            if keyword not in PRAGMA_KEYWORDS[name]:
+                raise ValueError(f"Invalid value for PRAGMA {name}: {value}")
+            statements.append(f"PRAGMA {name}={keyword}")
+        else:
+            raise ValueError(f"Unknown PRAGMA setting: {name}")
+    return statements
+
+
 # Global database instance
 database = Database()
 
@@ -114,4 +829,19 @@ def get_database() -> Database:
 
 def get_session() -> Generator[Session, None, None]:
     """Get database session - convenience function."""
-    yield from database.get_session()
\ No newline at end of file
+    yield from database.get_session()
+
+
+def session_scope():
+    """Read-only unit of work on this thread's session - convenience function."""
+    return database.session_scope()
+
+
+def write_scope(profile: str = "writer"):
+    """Unit of work on the writer session - convenience function."""
+    return database.write_scope(profile)
+
+
+def submit_write(job: Callable[[Session], Any]) -> Future:
+    """Queue a write job for the writer thread - convenience function."""
+    return database.submit_write(job)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import logging
+from typing import Callable, List
+
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+# Campaign counter column for each tracked CampaignContact status
+CAMPAIGN_STATUS_COUNTERS = {
+    "SENT": "sent_count",
+    "OPENED": "opened_count",
+    "RESPONDED": "responded_count",
+    "BOUNCED": "bounced_count",
+    "OPTOUT": "opted_out_count",
+    "ERROR": "error_count",
+}
+
+CONTACT_STATUSES = ("PENDING",) + tuple(CAMPAIGN_STATUS_COUNTERS)
+
+
+def _column_exists(connection: Connection, table: str, column: str) -> bool:
+    rows = connection.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def _campaign_counter_triggers(connection: Connection) -> None:
+    """Keep the Campaign counters in step with campaign_contacts.
+    
+    Triggers fire in the transaction that changes the rows, whichever code
+    path does it, and the counters of existing campaigns are backfilled.
+    """
+    if not _column_exists(connection, "campaigns", "error_count"):
+        connection.exec_driver_sql(
+            "ALTER TABLE campaigns ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0"
+        )
+        
+    def deltas(row: str, sign: str) -> str:
+        return ",\n".join(
+            f"    {column} = {column} {sign} ({row}.status = '{status}')"
+            for status, column in CAMPAIGN_STATUS_COUNTERS.items()
+        )
+        
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS campaign_contacts_counters_insert
+AFTER INSERT ON campaign_contacts
+BEGIN
+  UPDATE campaigns SET
+    contact_count = contact_count + 1,
+{deltas("NEW", "+")}
+  WHERE id = NEW.campaign_id;
+END
+""")
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS campaign_contacts_counters_delete
+AFTER DELETE ON campaign_contacts
+BEGIN
+  UPDATE campaigns SET
+    contact_count = contact_count - 1,
+{deltas("OLD", "-")}
+  WHERE id = OLD.campaign_id;
+END
+""")
+    changes = ",\n".join(
+        f"    {column} = {column} + (NEW.status = '{status}') - (OLD.status = '{status}')"
+        for status, column in CAMPAIGN_STATUS_COUNTERS.items()
+    )
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS campaign_contacts_counters_update
+AFTER UPDATE OF status ON campaign_contacts
+WHEN OLD.status IS NOT NEW.status
+BEGIN
+  UPDATE campaigns SET
+{changes}
+  WHERE id = NEW.campaign_id;
+END
+""")
+
+    # Backfill
+    counts = ",\n".join(
+        f"  {column} = (SELECT COUNT(*) FROM campaign_contacts cc "
+        f"WHERE cc.campaign_id = campaigns.id AND cc.status = '{status}')"
+        for status, column in CAMPAIGN_STATUS_COUNTERS.items()
+    )
+    connection.exec_driver_sql(f"""
+UPDATE campaigns SET
+  contact_count = (SELECT COUNT(*) FROM campaign_contacts cc WHERE cc.campaign_id = campaigns.id),
+{counts}
+""")
+
+
+def _stats_rollup_triggers(connection: Connection) -> None:
+    """Maintain the dashboard totals in stats_rollups.
+    
+    Rollups: "campaigns", "contacts", "emails_sent" (SENT mail logs) and
+    "contacts_<STATUS>" (campaign contacts per status).
+    """
+    def bump(name: str, delta: str) -> str:
+        return f"UPDATE stats_rollups SET value = value + {delta} WHERE name = {name};"
+        
+    triggers = {
+        "stats_campaigns_insert": ("AFTER INSERT ON campaigns", bump("'campaigns'", "1")),
+        "stats_campaigns_delete": ("AFTER DELETE ON campaigns", bump("'campaigns'", "-1")),
+        "stats_contacts_insert": ("AFTER INSERT ON contacts", bump("'contacts'", "1")),
+        "stats_contacts_delete": ("AFTER DELETE ON contacts", bump("'contacts'", "-1")),
+        "stats_mail_logs_insert": (
+            "AFTER INSERT ON mail_logs WHEN NEW.status = 'SENT'",
+            bump("'emails_sent'", "1")
+        ),
+        "stats_mail_logs_delete": (
+            "AFTER DELETE ON mail_logs WHEN OLD.status = 'SENT'",
+            bump("'emails_sent'", "-1")
+        ),
+        "stats_mail_logs_update": (
+            "AFTER UPDATE OF status ON mail_logs WHEN OLD.status IS NOT NEW.status",
+            bump("'emails_sent'", "(NEW.status = 'SENT') - (OLD.status = 'SENT')")
+        ),
+        "stats_campaign_contacts_insert": (
+            "AFTER INSERT ON campaign_contacts",
+            bump("'contacts_' || NEW.status", "1")
+        ),
+        "stats_campaign_contacts_delete": (
+            "AFTER DELETE ON campaign_contacts",
+            bump("'contacts_' || OLD.status", "-1")
+        ),
+        "stats_campaign_contacts_update": (
+            "AFTER UPDATE OF status ON campaign_contacts WHEN OLD.status IS NOT NEW.status",
+            bump("'contacts_' || OLD.status", "-1") + "\n  " + bump("'contacts_' || NEW.status", "1")
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {name} {event}\nBEGIN\n  {body}\nEND"
+        )
+        
+    # Backfill
+    connection.exec_driver_sql("DELETE FROM stats_rollups")
+    connection.exec_driver_sql("""
+INSERT INTO stats_rollups (name, value)
+SELECT 'campaigns', COUNT(*) FROM campaigns
+UNION ALL SELECT 'contacts', COUNT(*) FROM contacts
+UNION ALL SELECT 'emails_sent', COUNT(*) FROM mail_logs WHERE status = 'SENT'
+""")
+    for status in CONTACT_STATUSES:
+        connection.exec_driver_sql(
+            "INSERT INTO stats_rollups (name, value) "
+            "SELECT ?, COUNT(*) FROM campaign_contacts WHERE status = ?",
+            (f"contacts_{status}", status)
+        )
+
+
+def _contact_search_index(connection: Connection) -> None:
+    """Full-text index over contact emails and names for substring search.
+    
+    contacts_fts is an external-content FTS5 table with the trigram
+    tokenizer, kept in sync with contacts by triggers. Without FTS5 in the
+    SQLite build, search keeps using LIKE.
+    """
+    try:
+        connection.exec_driver_sql("""
+CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+  email, first_name, last_name,
+  content='contacts', content_rowid='id', tokenize='trigram'
+)
+""")
+    except OperationalError as e:
+        logger.warning(f"Contact search index not available, using LIKE search: {e}")
+        return
+        
+    columns = "email, first_name, last_name"
+    new_row = "NEW.id, NEW.email, NEW.first_name, NEW.last_name"
+    old_row = "OLD.id, OLD.email, OLD.first_name, OLD.last_name"
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts
+BEGIN
+  INSERT INTO contacts_fts (rowid, {columns}) VALUES ({new_row});
+END
+""")
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts
+BEGIN
+  INSERT INTO contacts_fts (contacts_fts, rowid, {columns}) VALUES ('delete', {old_row});
+END
+""")
+    connection.exec_driver_sql(f"""
+CREATE TRIGGER IF NOT EXISTS contacts_fts_update
+AFTER UPDATE OF {columns} ON contacts
+BEGIN
+  INSERT INTO contacts_fts (contacts_fts, rowid, {columns}) VALUES ('delete', {old_row});
+  INSERT INTO contacts_fts (rowid, {columns}) VALUES ({new_row});
+END
+""")
+    
+    # Backfill
+    connection.exec_driver_sql("INSERT INTO contacts_fts (contacts_fts) VALUES ('rebuild')")
+
+
+def _composite_indexes(connection: Connection) -> None:
+    """Composite indexes for the hot campaign_contacts, mail_logs and outbox filters.
+    
+    New databases get them from the models; the single-column
+    ix_mail_logs_wave_id is a prefix of the new mail_logs indexes.
+    """
+    indexes = {
+        "ix_campaign_contacts_campaign_id_status": "campaign_contacts (campaign_id, status, contact_id)",
+        "ix_mail_logs_wave_id_status": "mail_logs (wave_id, status)",
+        "ix_mail_logs_wave_id_contact_id": "mail_logs (wave_id, contact_id, retry_count)",
+        "ix_send_outbox_lease_owner": "send_outbox (lease_owner)",
+    }
+    for name, columns in indexes.items():
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+        
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_mail_logs_wave_id")
+
+
+# Applied in order, once per database; the index + 1 is stored in PRAGMA user_version
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    _campaign_counter_triggers,
+    _stats_rollup_triggers,
+    _contact_search_index,
+    _composite_indexes,
+]
+
+
+def run_migrations(engine: Engine) -> int:
+    """Apply the migrations a database file has not seen yet.
+    
+    Returns the number of migrations applied.
+    """
+    with engine.begin() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info(f"Applying database migration {number}: {migration.__name__}")
+            migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+            
+    return max(0, len(MIGRATIONS) - version)
\ No newline at end of file
@@ -1,8 +1,9 @@
 from .user import User, UserSession
 from .campaign import Campaign
-from .contact import Contact, CampaignContact
-from .email import EmailTemplate, MailLog, SendWave
+from .contact import Contact, CampaignContact, IndexedAttribute
+from .email import EmailTemplate, MailLog, SendWave, SendOutbox
 from .audit import AuditLog
+from .stats import StatsRollup
 
 __all__ = [
     "User",
@@ -10,8 +11,11 @@ __all__ = [
     "Campaign", 
     "Contact",
     "CampaignContact",
+    "IndexedAttribute",
     "EmailTemplate",
     "MailLog",
     "SendWave",
-    "AuditLog"
+    "SendOutbox",
+    "AuditLog",
+    "StatsRollup"
 ]
\ No newline at end of file
@@ -33,13 +33,14 @@ class Campaign(SQLModel, table=True):
         sa_column=Column(JSON)
     )
     
-    # Statistics (computed fields)
+    # Statistics, maintained by triggers on campaign_contacts (see migrations.py)
     contact_count: int = Field(default=0)
     sent_count: int = Field(default=0)
     opened_count: int = Field(default=0)
     responded_count: int = Field(default=0)
     bounced_count: int = Field(default=0)
     opted_out_count: int = Field(default=0)
+    error_count: int = Field(default=0)
     
     model_config = {
         "json_schema_extra": {
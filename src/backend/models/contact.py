@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 from enum import Enum
 
-from sqlmodel import SQLModel, Field, JSON, Column
+from sqlmodel import SQLModel, Field, JSON, Column, Index, UniqueConstraint
 
 
 class ContactStatus(str, Enum):
@@ -15,6 +15,11 @@ class ContactStatus(str, Enum):
     ERROR = "ERROR"
 
 
+class AttributeSource(str, Enum):
+    EXTRA_DATA = "EXTRA_DATA"    # Contact.extra_data
+    CUSTOM_DATA = "CUSTOM_DATA"  # CampaignContact.custom_data
+
+
 class Contact(SQLModel, table=True):
     """Contact model for email addresses."""
     
@@ -52,6 +57,10 @@ class CampaignContact(SQLModel, table=True):
     """Association table between campaigns and contacts with status tracking."""
     
     __tablename__ = "campaign_contacts"
+    __table_args__ = (
+        # Status filters within a campaign, paged by contact_id
+        Index("ix_campaign_contacts_campaign_id_status", "campaign_id", "status", "contact_id"),
+    )
     
     campaign_id: int = Field(foreign_key="campaigns.id", primary_key=True)
     contact_id: int = Field(foreign_key="contacts.id", primary_key=True)
@@ -76,4 +85,21 @@ class CampaignContact(SQLModel, table=True):
     )
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IndexedAttribute(SQLModel, table=True):
+    """JSON attribute exposed as an indexed generated column.
+    
+    The column is added to contacts (EXTRA_DATA) or campaign_contacts
+    (CUSTOM_DATA) as json_extract over the JSON data.
+    """
+    
+    __tablename__ = "indexed_attributes"
+    __table_args__ = (UniqueConstraint("name", "source"),)
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(max_length=100)
+    source: AttributeSource = Field(default=AttributeSource.EXTRA_DATA)
+    column_name: str = Field(max_length=64)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
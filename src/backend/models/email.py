@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 from enum import Enum
 
-from sqlmodel import SQLModel, Field, JSON, Column
+from sqlmodel import SQLModel, Field, JSON, Column, Index, UniqueConstraint
 
 
 class WaveType(str, Enum):
@@ -97,9 +97,15 @@ class MailLog(SQLModel, table=True):
     """Mail log model for tracking individual email sends."""
     
     __tablename__ = "mail_logs"
+    __table_args__ = (
+        # Per-wave counts by status
+        Index("ix_mail_logs_wave_id_status", "wave_id", "status"),
+        # Already-logged checks and the resume point of a wave
+        Index("ix_mail_logs_wave_id_contact_id", "wave_id", "contact_id", "retry_count"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    wave_id: int = Field(foreign_key="send_waves.id", index=True)
+    wave_id: int = Field(foreign_key="send_waves.id")
     contact_id: int = Field(foreign_key="contacts.id", index=True)
     template_id: Optional[int] = Field(foreign_key="email_templates.id")
     
@@ -113,4 +119,25 @@ class MailLog(SQLModel, table=True):
     body_sent: Optional[str] = Field()
     
     # Outlook specific data
-    outlook_message_id: Optional[str] = Field(max_length=255)
\ No newline at end of file
+    outlook_message_id: Optional[str] = Field(max_length=255)
+
+
+class SendOutbox(SQLModel, table=True):
+    """Durable queue of emails still to be sent for a wave.
+    
+    Rows only hold identifiers; contact data is loaded when a worker claims
+    them. A row is deleted once its final send result is recorded.
+    """
+    
+    __tablename__ = "send_outbox"
+    __table_args__ = (UniqueConstraint("wave_id", "contact_id"),)
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    wave_id: int = Field(foreign_key="send_waves.id", index=True)
+    contact_id: int = Field(foreign_key="contacts.id")
+    attempt: int = Field(default=0)
+    not_before: datetime = Field(default_factory=datetime.utcnow, index=True)
+    
+    # Claim held by a send worker; expired leases can be claimed again
+    lease_owner: Optional[str] = Field(default=None, max_length=64, index=True)
+    lease_until: Optional[datetime] = Field(default=None)
\ No newline at end of file
@@ -0,0 +1,10 @@
+from sqlmodel import SQLModel, Field
+
+
+class StatsRollup(SQLModel, table=True):
+    """Named application-wide counter, kept current by database triggers."""
+    
+    __tablename__ = "stats_rollups"
+    
+    name: str = Field(primary_key=True, max_length=64)
+    value: int = Field(default=0)
\ No newline at end of file
@@ -68,6 +68,14 @@ class IMailProvider(ABC):
         """Get the name of this email provider."""
         pass
     
+    def get_max_concurrency(self) -> int:
+        """Get how many sends this provider can run at the same time.
+        
+        Providers that are safe to call from several threads (SMTP, HTTP APIs)
+        should override this; the default keeps sends sequential.
+        """
+        return 1
+        
     def test_send(self, recipient: str) -> SendResult:
         """Send a test email to verify connectivity."""
         test_message = EmailMessage(
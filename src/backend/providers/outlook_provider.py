@@ -21,6 +21,10 @@ class OutlookCOMProvider(IMailProvider):
         self._last_connection_check = 0
         self._connection_check_interval = 60  # Check connection every 60 seconds
         
+        # Sender account resolved once per Outlook connection
+        self._sender_account = None
+        self._sender_account_outlook = None
+        
     def _get_outlook(self):
         """Get Outlook COM object with caching."""
         current_time = time.time()
@@ -75,6 +79,10 @@ class OutlookCOMProvider(IMailProvider):
         """Get provider name."""
         return "Outlook COM"
         
+    def get_max_concurrency(self) -> int:
+        """Outlook COM objects live in a single-threaded apartment: one send at a time."""
+        return 1
+        
     def send_email(self, message: EmailMessage) -> SendResult:
         """Send email through Outlook COM."""
         try:
@@ -100,23 +108,9 @@ class OutlookCOMProvider(IMailProvider):
                 
             # Set sender if specified
             if self.sender_email:
-                try:
-                    # Try to set the sender account
-                    accounts = outlook.Session.Accounts
-                    sender_account = None
-                    
-                    for account in accounts:
-                        if account.SmtpAddress.lower() == self.sender_email.lower():
-                            sender_account = account
-                            break
-                            
-                    if sender_account:
-                        mail.SendUsingAccount = sender_account
-                    else:
-                        logger.warning(f"Sender email {self.sender_email} not found in Outlook accounts")
-                        
-                except Exception as e:
-                    logger.warning(f"Could not set sender account: {e}")
+                sender_account = self._get_sender_account(outlook)
+                if sender_account:
+                    mail.SendUsingAccount = sender_account
                     
             # Add attachments
             for attachment_path in message.attachments:
@@ -165,6 +159,29 @@ class OutlookCOMProvider(IMailProvider):
                 retry_after=30 if should_retry else None
             )
             
+    def _get_sender_account(self, outlook):
+        """Resolve the Outlook account for sender_email, once per connection."""
+        if self._sender_account_outlook is outlook:
+            return self._sender_account
+            
+        sender_account = None
+        try:
+            for account in outlook.Session.Accounts:
+                if account.SmtpAddress.lower() == self.sender_email.lower():
+                    sender_account = account
+                    break
+                    
+            if not sender_account:
+                logger.warning(f"Sender email {self.sender_email} not found in Outlook accounts")
+                
+        except Exception as e:
+            logger.warning(f"Could not set sender account: {e}")
+            return None
+            
+        self._sender_account = sender_account
+        self._sender_account_outlook = outlook
+        return sender_account
+        
     def get_available_accounts(self) -> list:
         """Get list of available Outlook accounts."""
         try:
@@ -4,7 +4,7 @@ from typing import Optional, Dict, Any
 
 from sqlmodel import Session
 
-from ..database import get_session
+from ..database import submit_write
 from ..models.audit import AuditLog
 
 logger = logging.getLogger(__name__)
@@ -27,25 +27,33 @@ class AuditService:
         user_agent: Optional[str] = None,
         system_user: Optional[str] = None
     ) -> AuditLog:
-        """Log an action to the audit trail."""
+        """Log an action to the audit trail.
+        
+        The entry is queued for the database writer's next group commit, so
+        callers never wait on it; its id is set once it is committed.
+        """
         
         try:
-            with next(get_session()) as session:
-                audit_entry = AuditLog(
-                    user_id=user_id,
-                    action=action,
-                    entity_type=entity_type,
-                    entity_id=entity_id,
-                    details=details or {},
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    system_user=system_user
-                )
-                
+            audit_entry = AuditLog(
+                user_id=user_id,
+                action=action,
+                entity_type=entity_type,
+                entity_id=entity_id,
+                details=details or {},
+                ip_address=ip_address,
+                user_agent=user_agent,
+                system_user=system_user
+            )
+            
+            def write(session: Session):
                 session.add(audit_entry)
-                session.commit()
-                session.refresh(audit_entry)
+                session.flush()
                 
+            def logged(future):
+                if future.exception():
+                    logger.error(f"Failed to create audit log entry: {future.exception()}")
+                    return
+                    
                 # Also log to structured logger for external systems
                 self.logger.info(
                     "Audit log entry created",
@@ -61,8 +69,9 @@ class AuditService:
                     }
                 )
                 
-                return audit_entry
-                
+            submit_write(write).add_done_callback(logged)
+            return audit_entry
+            
         except Exception as e:
             logger.error(f"Failed to create audit log entry: {e}")
             # Don't raise - audit logging should never break the main functionality
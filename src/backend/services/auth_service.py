@@ -4,9 +4,10 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 
 from passlib.context import CryptContext
+from sqlalchemy import update
 from sqlmodel import Session, select
 
-from ..database import get_session
+from ..database import session_scope, submit_write, write_scope
 from ..models.user import User, UserSession, UserRole
 from .audit_service import AuditService
 
@@ -40,7 +41,10 @@ class AuthService:
         
     def create_user(self, email: str, password: str, role: UserRole = UserRole.OPERATOR) -> User:
         """Create a new user."""
-        for session in get_session():
+        # Hashed before taking the writer, which other writes wait on
+        password_hash = self.hash_password(password)
+        
+        with write_scope() as session:
             # Check if user already exists
             existing_user = session.exec(
                 select(User).where(User.email == email)
@@ -52,7 +56,7 @@ class AuthService:
             # Create new user
             user = User(
                 email=email,
-                password_hash=self.hash_password(password),
+                password_hash=password_hash,
                 role=role
             )
             
@@ -74,31 +78,36 @@ class AuthService:
             
     def authenticate(self, email: str, password: str, ip_address: str = None) -> Dict[str, Any]:
         """Authenticate a user and return session data."""
-        for session in get_session():
+        with session_scope() as session:
             user = session.exec(
                 select(User).where(User.email == email)
             ).first()
             
-            if not user:
-                self.audit_service.log_action(
-                    user_id=None,
-                    action="LOGIN_FAILED",
-                    details={"email": email, "reason": "user_not_found"},
-                    ip_address=ip_address
-                )
-                raise AuthError("Invalid credentials")
-                
-            # Check if user is locked
-            if user.locked_until and user.locked_until > datetime.utcnow():
-                remaining = (user.locked_until - datetime.utcnow()).total_seconds()
-                raise AuthError(f"Account locked. Try again in {int(remaining)} seconds")
-                
-            # Check if user is active
-            if not user.is_active:
-                raise AuthError("Account deactivated")
-                
-            # Verify password
-            if not self.verify_password(password, user.password_hash):
+        if not user:
+            self.audit_service.log_action(
+                user_id=None,
+                action="LOGIN_FAILED",
+                details={"email": email, "reason": "user_not_found"},
+                ip_address=ip_address
+            )
+            raise AuthError("Invalid credentials")
+            
+        # Check if user is locked
+        if user.locked_until and user.locked_until > datetime.utcnow():
+            remaining = (user.locked_until - datetime.utcnow()).total_seconds()
+            raise AuthError(f"Account locked. Try again in {int(remaining)} seconds")
+            
+        # Check if user is active
+        if not user.is_active:
+            raise AuthError("Account deactivated")
+            
+        # Verify password, before taking the writer
+        password_ok = self.verify_password(password, user.password_hash)
+        
+        with write_scope() as session:
+            user = session.get(User, user.id)
+            
+            if not password_ok:
                 # Increment failed attempts
                 user.failed_login_attempts += 1
                 
@@ -106,50 +115,50 @@ class AuthService:
                     user.locked_until = datetime.utcnow() + self.lockout_duration
                     
                 session.add(user)
-                session.commit()
+                session_token = None
+            else:
+                # Reset failed attempts on successful login
+                user.failed_login_attempts = 0
+                user.locked_until = None
+                user.last_login = datetime.utcnow()
                 
-                self.audit_service.log_action(
-                    user_id=user.id,
-                    action="LOGIN_FAILED",
-                    details={"reason": "invalid_password", "attempts": user.failed_login_attempts},
-                    ip_address=ip_address
-                )
+                # Create session
+                session_token = self.create_session(user.id, ip_address)
                 
-                raise AuthError("Invalid credentials")
+                session.add(user)
                 
-            # Reset failed attempts on successful login
-            user.failed_login_attempts = 0
-            user.locked_until = None
-            user.last_login = datetime.utcnow()
-            
-            # Create session
-            session_token = self.create_session(user.id, ip_address)
-            
-            session.add(user)
-            session.commit()
-            
+        if not password_ok:
             self.audit_service.log_action(
                 user_id=user.id,
-                action="LOGIN_SUCCESS",
-                details={"email": email},
+                action="LOGIN_FAILED",
+                details={"reason": "invalid_password", "attempts": user.failed_login_attempts},
                 ip_address=ip_address
             )
             
-            logger.info(f"User authenticated: {email}")
-            
-            return {
-                "user": {
-                    "id": user.id,
-                    "email": user.email,
-                    "role": user.role.value,
-                    "last_login": user.last_login.isoformat() if user.last_login else None
-                },
-                "session_token": session_token
-            }
+            raise AuthError("Invalid credentials")
             
+        self.audit_service.log_action(
+            user_id=user.id,
+            action="LOGIN_SUCCESS",
+            details={"email": email},
+            ip_address=ip_address
+        )
+        
+        logger.info(f"User authenticated: {email}")
+        
+        return {
+            "user": {
+                "id": user.id,
+                "email": user.email,
+                "role": user.role.value,
+                "last_login": user.last_login.isoformat() if user.last_login else None
+            },
+            "session_token": session_token
+        }
+        
     def create_session(self, user_id: int, ip_address: str = None) -> str:
         """Create a new user session."""
-        for session in get_session():
+        with write_scope() as session:
             # Generate secure session token
             session_token = secrets.token_urlsafe(32)
             
@@ -167,8 +176,12 @@ class AuthService:
             return session_token
             
     def validate_session(self, session_token: str) -> Optional[User]:
-        """Validate a session token and return the user."""
-        for session in get_session():
+        """Validate a session token and return the user.
+        
+        The last activity update is queued for the writer thread instead of
+        making every request wait for a write.
+        """
+        with session_scope() as session:
             user_session = session.exec(
                 select(UserSession).where(UserSession.session_token == session_token)
             ).first()
@@ -178,14 +191,12 @@ class AuthService:
                 
             # Check if session is expired
             if user_session.expires_at < datetime.utcnow():
-                session.delete(user_session)
-                session.commit()
+                with write_scope() as write_session:
+                    expired = write_session.get(UserSession, user_session.id)
+                    if expired:
+                        write_session.delete(expired)
                 return None
                 
-            # Update last activity
-            user_session.last_activity = datetime.utcnow()
-            session.add(user_session)
-            
             # Get user
             user = session.exec(
                 select(User).where(User.id == user_session.user_id)
@@ -194,12 +205,22 @@ class AuthService:
             if not user or not user.is_active:
                 return None
                 
-            session.commit()
-            return user
+        # Update last activity
+        last_activity = datetime.utcnow()
+        
+        def touch(write_session: Session):
+            write_session.exec(
+                update(UserSession)
+                .where(UserSession.id == user_session.id)
+                .values(last_activity=last_activity)
+            )
+            
+        submit_write(touch)
+        return user
             
     def logout(self, session_token: str) -> bool:
         """Logout user by invalidating session."""
-        for session in get_session():
+        with write_scope() as session:
             user_session = session.exec(
                 select(UserSession).where(UserSession.session_token == session_token)
             ).first()
@@ -222,35 +243,39 @@ class AuthService:
             
     def change_password(self, user_id: int, old_password: str, new_password: str) -> bool:
         """Change user password."""
-        for session in get_session():
+        with session_scope() as session:
+            user = session.get(User, user_id)
+            
+        if not user:
+            raise AuthError("User not found")
+            
+        # Verify old password
+        if not self.verify_password(old_password, user.password_hash):
+            raise AuthError("Invalid current password")
+            
+        password_hash = self.hash_password(new_password)
+        
+        with write_scope() as session:
             user = session.get(User, user_id)
             
-            if not user:
-                raise AuthError("User not found")
-                
-            # Verify old password
-            if not self.verify_password(old_password, user.password_hash):
-                raise AuthError("Invalid current password")
-                
             # Update password
-            user.password_hash = self.hash_password(new_password)
+            user.password_hash = password_hash
             user.password_changed_at = datetime.utcnow()
             
             session.add(user)
-            session.commit()
-            
-            self.audit_service.log_action(
-                user_id=user_id,
-                action="PASSWORD_CHANGED",
-                details={}
-            )
             
-            logger.info(f"Password changed for user: {user.email}")
-            return True
+        self.audit_service.log_action(
+            user_id=user_id,
+            action="PASSWORD_CHANGED",
+            details={}
+        )
+        
+        logger.info(f"Password changed for user: {user.email}")
+        return True
             
     def cleanup_expired_sessions(self) -> int:
         """Clean up expired sessions and return count of deleted sessions."""
-        for session in get_session():
+        with write_scope() as session:
             expired_sessions = session.exec(
                 select(UserSession).where(UserSession.expires_at < datetime.utcnow())
             ).all()
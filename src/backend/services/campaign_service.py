@@ -1,15 +1,24 @@
+import json
 import logging
+import time
 from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from itertools import islice
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from pathlib import Path
 
 import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import update
 from sqlmodel import Session, select, func, and_
 
-from ..database import get_session
+from ..database import session_scope, write_scope
 from ..models.campaign import Campaign, CampaignStatus
 from ..models.contact import Contact, CampaignContact, ContactStatus
-from .contact_service import ContactService, MergeMode
+from ..models.stats import StatsRollup
+from .contact_service import (
+    ContactService, ContactBatch, MergeMode, EMAIL_PATTERN, STANDARD_CONTACT_FIELDS,
+    counter_contact_stats
+)
 from .audit_service import AuditService
 
 logger = logging.getLogger(__name__)
@@ -31,11 +40,23 @@ class CampaignService:
         self.max_file_size = 50 * 1024 * 1024  # 50 MB
         self.max_rows = 50000
         self.required_columns = ["email", "first_name", "last_name"]
+        self.supported_extensions = ['.xlsx', '.xls', '.csv']
+        
+        # Rows read, cleaned and committed per step of the import pipeline
+        self.chunk_size = 1000
+        
+        # Validation results keyed by (path, size, mtime)
+        self._validation_cache: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        self.validation_cache_size = 8
+        
+        # Dashboard totals are served from memory for a few seconds
+        self.dashboard_cache_ttl = 5
+        self._dashboard_cache: Optional[Tuple[float, Dict[str, Any]]] = None
         
     def create_campaign(self, title: str, owner_id: int, launch_date: date = None,
                        default_language: str = "en", metadata: Dict[str, Any] = None) -> Campaign:
         """Create a new campaign."""
-        for session in get_session():
+        with write_scope() as session:
             campaign = Campaign(
                 title=title,
                 owner_id=owner_id,
@@ -65,13 +86,13 @@ class CampaignService:
             
     def get_campaign(self, campaign_id: int) -> Optional[Campaign]:
         """Get a campaign by ID."""
-        for session in get_session():
+        with session_scope() as session:
             return session.get(Campaign, campaign_id)
             
     def list_campaigns(self, owner_id: int = None, status: CampaignStatus = None,
                       limit: int = 100, offset: int = 0) -> List[Campaign]:
         """List campaigns with optional filters."""
-        for session in get_session():
+        with session_scope() as session:
             query = select(Campaign)
             
             if owner_id:
@@ -86,7 +107,7 @@ class CampaignService:
             
     def update_campaign(self, campaign_id: int, user_id: int, **updates) -> Optional[Campaign]:
         """Update a campaign."""
-        for session in get_session():
+        with write_scope() as session:
             campaign = session.get(Campaign, campaign_id)
             
             if not campaign:
@@ -123,7 +144,12 @@ class CampaignService:
             return campaign
             
     def validate_excel_file(self, file_path: str) -> Dict[str, Any]:
-        """Validate Excel file before import."""
+        """Validate Excel file before import.
+        
+        The file is inspected in a single pass and the result is cached by
+        path, size and modification time, so a following ``import_excel`` on
+        the same file does not parse it again.
+        """
         try:
             # Check file exists
             path = Path(file_path)
@@ -131,50 +157,94 @@ class CampaignService:
                 raise ImportError("File does not exist")
                 
             # Check file size
-            if path.stat().st_size > self.max_file_size:
+            file_stat = path.stat()
+            if file_stat.st_size > self.max_file_size:
                 raise ImportError(f"File too large. Maximum size is {self.max_file_size // (1024*1024)} MB")
                 
             # Check file extension
-            if path.suffix.lower() not in ['.xlsx', '.xls']:
-                raise ImportError("Invalid file format. Only Excel files (.xlsx, .xls) are supported")
+            if path.suffix.lower() not in self.supported_extensions:
+                raise ImportError("Invalid file format. Only Excel (.xlsx, .xls) and CSV files are supported")
+                
+            cache_key = (str(path.resolve()), file_stat.st_size, file_stat.st_mtime_ns)
+            cached = self._validation_cache.get(cache_key)
+            if cached is not None:
+                return cached
                 
             # Try to read the file
             try:
-                # Read first few rows to validate structure
-                df = pd.read_excel(file_path, nrows=10)
+                columns, df, row_count = self._inspect_file(file_path)
             except Exception as e:
                 raise ImportError(f"Unable to read Excel file: {str(e)}")
                 
             # Check required columns
-            missing_columns = set(self.required_columns) - set(df.columns)
+            missing_columns = set(self.required_columns) - set(columns)
             if missing_columns:
                 raise ImportError(f"Missing required columns: {', '.join(missing_columns)}")
                 
-            # Get total row count
-            df_full = pd.read_excel(file_path)
-            row_count = len(df_full)
-            
             if row_count > self.max_rows:
                 raise ImportError(f"Too many rows. Maximum is {self.max_rows}")
                 
             # Validate email format in sample
             if 'email' in df.columns:
-                invalid_emails = df[df['email'].isna() | (df['email'].str.strip() == '')].index.tolist()
+                invalid_emails = df[df['email'].isna() | (df['email'].astype(str).str.strip() == '')].index.tolist()
                 if invalid_emails:
                     logger.warning(f"Found {len(invalid_emails)} rows with invalid emails")
                     
-            return {
+            result = {
                 "valid": True,
                 "row_count": row_count,
-                "columns": list(df_full.columns),
+                "columns": columns,
                 "preview": df.head().to_dict('records')
             }
             
+            # Only keep the most recent files, the cache is for validate-then-import
+            if len(self._validation_cache) >= self.validation_cache_size:
+                self._validation_cache.pop(next(iter(self._validation_cache)))
+            self._validation_cache[cache_key] = result
+            
+            return result
+            
         except ImportError:
             raise
         except Exception as e:
             raise ImportError(f"File validation failed: {str(e)}")
             
+    def _inspect_file(self, file_path: str, preview_rows: int = 10) -> Tuple[List[str], pd.DataFrame, int]:
+        """Read header, preview rows and row count of a spreadsheet in one pass.
+        
+        For ``.xlsx`` files the row count comes from the sheet's dimension
+        metadata when present; otherwise rows are counted while streaming.
+        """
+        suffix = Path(file_path).suffix.lower()
+        
+        if suffix == '.xlsx':
+            workbook = load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                sheet = workbook.active
+                rows = sheet.iter_rows(values_only=True)
+                columns = _column_names(next(rows, None) or ())
+                preview = [_fit_row(row, len(columns)) for row in islice(rows, preview_rows)]
+                
+                if sheet.max_row is not None:
+                    row_count = max(sheet.max_row - 1, 0)
+                else:
+                    row_count = len(preview) + sum(1 for _ in rows)
+            finally:
+                workbook.close()
+                
+            return columns, pd.DataFrame.from_records(preview, columns=columns), row_count
+            
+        # CSV and legacy .xls: the first chunk gives the header and preview,
+        # the rest of the stream is only counted
+        columns, df, row_count = [], pd.DataFrame(), 0
+        for chunk_num, chunk in enumerate(self._read_chunks(file_path)):
+            if chunk_num == 0:
+                columns = [str(column) for column in chunk.columns]
+                df = chunk.head(preview_rows)
+            row_count += len(chunk)
+            
+        return columns, df, row_count
+        
     def import_excel(self, campaign_id: int, file_path: str, mode: MergeMode = MergeMode.REPLACE,
                     user_id: int = None, progress_callback=None) -> Dict[str, Any]:
         """Import contacts from Excel file."""
@@ -184,40 +254,34 @@ class CampaignService:
             
             logger.info(f"Starting Excel import for campaign {campaign_id}: {file_path}")
             
-            # Read Excel file in chunks for memory efficiency
-            chunk_size = 1000
-            chunks = pd.read_excel(file_path, chunksize=chunk_size)
-            
-            all_contacts = []
-            total_processed = 0
-            
-            # Process chunks
-            for chunk_num, chunk in enumerate(chunks):
-                # Clean data
-                chunk = self._clean_excel_data(chunk)
-                
-                # Convert to dict records
-                contacts_data = chunk.to_dict('records')
-                all_contacts.extend(contacts_data)
-                
-                total_processed += len(contacts_data)
-                
-                # Report progress
+            total_rows = validation_result["row_count"]
+            rows_read = 0
+            
+            def cleaned_batches():
+                """Read, clean and hand over one chunk at a time."""
+                nonlocal rows_read
+                seen_emails = set()
+                for chunk_num, chunk in enumerate(self._read_chunks(file_path)):
+                    rows_read += len(chunk)
+                    logger.info(f"Processed chunk {chunk_num + 1}, total rows: {rows_read}")
+                    yield self._clean_excel_data(chunk, seen_emails)
+                    
+            def on_batch_committed(processed: int):
+                # Batches are pulled lazily, so rows_read matches what has been committed
                 if progress_callback:
-                    progress_callback(total_processed, validation_result["row_count"])
+                    progress_callback(rows_read, total_rows)
                     
-                logger.info(f"Processed chunk {chunk_num + 1}, total rows: {total_processed}")
-                
-            # Bulk add contacts to campaign
-            stats = self.contact_service.bulk_add_contacts_to_campaign(
+            # Stream chunks straight into the database
+            stats = self.contact_service.bulk_add_contact_batches(
                 campaign_id=campaign_id,
-                contacts_data=all_contacts,
+                batches=cleaned_batches(),
                 mode=mode,
-                user_id=user_id
+                user_id=user_id,
+                progress_callback=on_batch_committed
             )
             
             # Update campaign status
-            for session in get_session():
+            with write_scope() as session:
                 campaign = session.get(Campaign, campaign_id)
                 if campaign and campaign.status == CampaignStatus.DRAFT:
                     campaign.status = CampaignStatus.ACTIVE
@@ -254,39 +318,111 @@ class CampaignService:
                 
             raise ImportError(f"Import failed: {str(e)}")
             
-    def _clean_excel_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Clean and validate Excel data."""
+    def _read_chunks(self, file_path: str) -> Iterator[pd.DataFrame]:
+        """Stream a spreadsheet as DataFrames of at most ``chunk_size`` rows.
+        
+        ``.xlsx`` files are read with openpyxl in read-only mode and CSV files
+        with pandas' chunked reader, so memory stays bounded by the chunk size.
+        Legacy ``.xls`` files have no streaming reader and are sliced after a
+        full read.
+        """
+        suffix = Path(file_path).suffix.lower()
+        
+        if suffix == '.csv':
+            yield from pd.read_csv(file_path, chunksize=self.chunk_size)
+            return
+            
+        if suffix == '.xls':
+            df = pd.read_excel(file_path)
+            for start in range(0, len(df), self.chunk_size):
+                yield df.iloc[start:start + self.chunk_size]
+            return
+            
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+                
+            columns = _column_names(header)
+            
+            chunk = []
+            for row in rows:
+                chunk.append(_fit_row(row, len(columns)))
+                if len(chunk) >= self.chunk_size:
+                    yield pd.DataFrame.from_records(chunk, columns=columns)
+                    chunk = []
+                    
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+        finally:
+            workbook.close()
+            
+    def _clean_excel_data(self, df: pd.DataFrame, seen_emails: set = None) -> ContactBatch:
+        """Clean and validate Excel data into a column batch ready to insert.
+        
+        Normalization, email validation, de-duplication and the split into
+        standard and extra columns are all columnar operations on the chunk.
+        ``seen_emails`` carries de-duplication across the chunks of one import.
+        """
         # Remove completely empty rows
         df = df.dropna(how='all')
+        row_count = len(df)
+        
+        # Normalize emails and remove rows with invalid ones
+        emails = df['email'].astype('string').str.strip().str.lower()
+        valid = emails.str.match(EMAIL_PATTERN.pattern).fillna(False).astype(bool)
+        df, emails = df[valid], emails[valid]
+        errors = row_count - len(df)
         
-        # Clean email column
-        if 'email' in df.columns:
-            df['email'] = df['email'].astype(str).str.strip().str.lower()
-            # Remove rows with invalid emails
-            df = df[df['email'].str.contains('@', na=False)]
-            df = df[df['email'] != '']
+        # Remove duplicates based on email, within the chunk and across chunks
+        duplicated = emails.duplicated(keep='first')
+        if seen_emails:
+            duplicated |= emails.isin(seen_emails)
+        df, emails = df[~duplicated], emails[~duplicated]
+        skipped = int(duplicated.sum())
+        
+        if seen_emails is not None:
+            seen_emails.update(emails)
             
         # Clean name columns
+        names = {}
         for col in ['first_name', 'last_name']:
             if col in df.columns:
-                df[col] = df[col].astype(str).str.strip()
-                df[col] = df[col].replace('nan', '')
+                names[col] = df[col].fillna('').astype(str).str.strip().tolist()
+            else:
+                names[col] = [''] * len(df)
                 
-        # Remove duplicates based on email
-        df = df.drop_duplicates(subset=['email'], keep='first')
-        
-        return df
+        # Everything else goes to extra_data; the JSON round trip converts
+        # dates, NaN and numpy scalars to JSON-safe values in one pass
+        extra_columns = [col for col in df.columns if col not in STANDARD_CONTACT_FIELDS]
+        if extra_columns and len(df):
+            extra_data = json.loads(
+                df[extra_columns].to_json(orient='records', date_format='iso', force_ascii=False)
+            )
+        else:
+            extra_data = [None] * len(df)
+            
+        return ContactBatch(
+            emails=emails.tolist(),
+            first_names=names['first_name'],
+            last_names=names['last_name'],
+            extra_data=extra_data,
+            skipped=skipped,
+            errors=errors
+        )
         
     def get_campaign_statistics(self, campaign_id: int) -> Dict[str, Any]:
         """Get comprehensive statistics for a campaign."""
-        contact_stats = self.contact_service.get_campaign_contact_stats(campaign_id)
-        
-        for session in get_session():
+        with session_scope() as session:
             campaign = session.get(Campaign, campaign_id)
             
             if not campaign:
                 return {}
                 
+            contact_stats = self.get_contact_stats(campaign)
+            
             # Get send wave count (placeholder for now)
             wave_count = 0  # TODO: Implement when SendWave table is available
             
@@ -305,9 +441,78 @@ class CampaignService:
                 }
             }
             
+    def get_dashboard_stats(self) -> Dict[str, Any]:
+        """Get totals across all campaigns for the home screen.
+        
+        Read from the stats_rollups table, which database triggers keep
+        current. The response rate is the share of contacts reached by an
+        email (sent, opened or responded) who responded.
+        """
+        cached = self._dashboard_cache
+        if cached and time.monotonic() - cached[0] < self.dashboard_cache_ttl:
+            return dict(cached[1])
+            
+        with session_scope() as session:
+            rollups = dict(session.exec(select(StatsRollup.name, StatsRollup.value)).all())
+            
+        responded = rollups.get(f"contacts_{ContactStatus.RESPONDED.value}", 0)
+        reached = responded + sum(
+            rollups.get(f"contacts_{status.value}", 0)
+            for status in (ContactStatus.SENT, ContactStatus.OPENED)
+        )
+        
+        stats = {
+            "total_campaigns": rollups.get("campaigns", 0),
+            "total_contacts": rollups.get("contacts", 0),
+            "emails_sent": rollups.get("emails_sent", 0),
+            "response_rate": round(responded / reached * 100, 2) if reached else 0.0
+        }
+        
+        self._dashboard_cache = (time.monotonic(), stats)
+        return dict(stats)
+        
+    def get_contact_stats(self, campaign: Campaign) -> Dict[str, Any]:
+        """Per-status contact counts of a campaign, read from its counters."""
+        return counter_contact_stats(campaign)
+        
+    def recompute_campaign_counters(self, campaign_ids: List[int] = None) -> int:
+        """Recount the contact counters of campaigns from campaign_contacts.
+        
+        Repairs counters that drifted, e.g. after rows were edited with the
+        triggers missing. All campaigns are recounted by default. Returns the
+        number of campaigns updated.
+        """
+        with write_scope() as session:
+            if campaign_ids is None:
+                campaign_ids = session.exec(select(Campaign.id)).all()
+            if not campaign_ids:
+                return 0
+                
+            all_stats = self.contact_service.get_campaigns_contact_stats(campaign_ids)
+            session.exec(
+                update(Campaign),
+                params=[
+                    {
+                        "id": campaign_id,
+                        "contact_count": stats["total_count"],
+                        "sent_count": stats["sent_count"],
+                        "opened_count": stats["opened_count"],
+                        "responded_count": stats["responded_count"],
+                        "bounced_count": stats["bounced_count"],
+                        "opted_out_count": stats["optout_count"],
+                        "error_count": stats["error_count"]
+                    }
+                    for campaign_id, stats in all_stats.items()
+                ]
+            )
+            session.commit()
+            
+            logger.info(f"Recomputed counters of {len(all_stats)} campaigns")
+            return len(all_stats)
+            
     def export_campaign_results(self, campaign_id: int, format: str = "xlsx") -> str:
         """Export campaign results to file."""
-        for session in get_session():
+        with session_scope() as session:
             # Get campaign data with contacts
             query = select(
                 Contact.email,
@@ -364,7 +569,7 @@ class CampaignService:
             
     def delete_campaign(self, campaign_id: int, user_id: int) -> bool:
         """Delete a campaign and all associated data."""
-        for session in get_session():
+        with write_scope() as session:
             campaign = session.get(Campaign, campaign_id)
             
             if not campaign:
@@ -386,4 +591,21 @@ class CampaignService:
             session.commit()
             
             logger.info(f"Campaign deleted: {campaign.title} (ID: {campaign_id})")
-            return True
\ No newline at end of file
+            return True
+
+
+def _column_names(header: Tuple[Any, ...]) -> List[str]:
+    """Turn a spreadsheet header row into column names, like pandas does."""
+    return [
+        str(name) if name is not None else f"Unnamed: {index}"
+        for index, name in enumerate(header)
+    ]
+
+
+def _fit_row(row: Tuple[Any, ...], width: int) -> Tuple[Any, ...]:
+    """Cut or pad a row to the header width.
+    
+    Without a ``<dimension>`` element openpyxl yields rows only as long as
+    their last non-empty cell, so trailing empty columns must be added back.
+    """
+    return row[:width] + (None,) * (width - len(row))
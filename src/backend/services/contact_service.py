@@ -1,32 +1,96 @@
 import logging
-from typing import List, Optional, Dict, Any, Tuple
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Iterator, Callable
 from enum import Enum
 
+from sqlalchemy import case, column, delete, literal_column, table, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select, func, and_, or_
 
-from ..database import get_session
-from ..models.contact import Contact, CampaignContact, ContactStatus
+from ..database import session_scope, write_scope
+from ..models.contact import Contact, CampaignContact, ContactStatus, AttributeSource, IndexedAttribute
 from ..models.campaign import Campaign
 from .audit_service import AuditService
 
 logger = logging.getLogger(__name__)
 
+# Columns stored on Contact itself; anything else goes to extra_data
+STANDARD_CONTACT_FIELDS = ("email", "first_name", "last_name")
+
+# Shape check for lower-cased imported addresses (HTML5 form grammar, dotted domain)
+EMAIL_PATTERN = re.compile(
+    r"^[a-z0-9.!#$%&'*+/=?^_`{|}~-]+"
+    r"@[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)+$"
+)
+
+
+# FTS5 index over contact emails and names (see migrations.py)
+CONTACTS_FTS = table("contacts_fts", column("rowid"), column("email"), column("first_name"), column("last_name"))
+
+# The trigram tokenizer cannot match shorter queries
+FTS_MIN_QUERY_LENGTH = 3
+
+# Table and JSON column holding the attributes of each source
+ATTRIBUTE_SOURCES = {
+    AttributeSource.EXTRA_DATA: (Contact.__table__, "extra_data"),
+    AttributeSource.CUSTOM_DATA: (CampaignContact.__table__, "custom_data"),
+}
+
+# Criteria keys holding attribute predicates, e.g. {"attributes": {"department": "Sales"}}
+ATTRIBUTE_CRITERIA_KEYS = {
+    "attributes": AttributeSource.EXTRA_DATA,
+    "custom_attributes": AttributeSource.CUSTOM_DATA,
+}
+
 
 class MergeMode(str, Enum):
     REPLACE = "REPLACE"
     APPEND = "APPEND"
 
 
+@dataclass
+class ContactBatch:
+    """Column-oriented batch of normalized, de-duplicated contacts ready to insert."""
+    emails: List[str] = field(default_factory=list)
+    first_names: List[str] = field(default_factory=list)
+    last_names: List[str] = field(default_factory=list)
+    extra_data: List[Optional[Dict[str, Any]]] = field(default_factory=list)
+    
+    # Rows dropped while building the batch
+    skipped: int = 0
+    errors: int = 0
+    
+    def __len__(self) -> int:
+        return len(self.emails)
+
+
 class ContactService:
     """Service for managing contacts and campaign associations."""
     
     def __init__(self):
         self.audit_service = AuditService()
+        
+        # Rows upserted and committed per transaction during bulk imports
+        self.bulk_batch_size = 1000
+        
+        # Largest page list_campaign_contacts returns
+        self.max_page_size = 500
+        
+        # Whether the contacts_fts search index exists, checked on first search
+        self._fts_available: Optional[bool] = None
+        
+        # Campaigns up to this size are searched with a scan instead of the index
+        self.search_scan_max_contacts = 10000
+        
+        # Index matches ranked per search, for each of the prefix and substring queries
+        self.search_candidates = 500
     
     def create_contact(self, email: str, first_name: str = None, last_name: str = None, 
                       extra_data: Dict[str, Any] = None) -> Contact:
         """Create a new contact."""
-        for session in get_session():
+        with write_scope() as session:
             contact = Contact(
                 email=email,
                 first_name=first_name,
@@ -41,26 +105,180 @@ class ContactService:
             logger.info(f"Contact created: {email} (ID: {contact.id})")
             return contact
     
-    def search_contacts(self, query: str, limit: int = 50) -> List[Contact]:
-        """Search contacts by email or name."""
-        for session in get_session():
-            search_pattern = f"%{query.lower()}%"
-            contacts = session.exec(
-                select(Contact).where(
-                    or_(
-                        Contact.email.ilike(search_pattern),
-                        Contact.first_name.ilike(search_pattern),
-                        Contact.last_name.ilike(search_pattern)
-                    )
-                ).limit(limit)
-            ).all()
+    def search_all_contacts(self, query: str, limit: int = 50) -> List[Contact]:
+        """Search contacts by email or name, best matches first."""
+        with session_scope() as session:
+            contact_ids = self._search_contact_ids(session, query, limit)
+            if contact_ids is None:
+                # Too short for the index: rank a bounded set of scanned matches
+                search_filter = self._like_filter(query)
+                candidates = max(limit, self.search_candidates)
+            else:
+                search_filter = Contact.id.in_(contact_ids)
+                candidates = limit
+                
+            contacts = session.exec(select(Contact).where(search_filter).limit(candidates)).all()
+            
+            return sorted(
+                contacts,
+                key=lambda contact: (
+                    _search_rank(query, contact.email, contact.first_name, contact.last_name), contact.id
+                )
+            )[:limit]
             
-            return list(contacts)
+    def _search_contact_ids(self, session: Session, query: str, limit: int,
+                            campaign_id: int = None, status: ContactStatus = None,
+                            conditions: Dict[AttributeSource, List] = None) -> Optional[List[int]]:
+        """IDs of the ``limit`` best contacts matching ``query``, found with the contacts_fts index.
+        
+        Ranking every match would read all of them for a common query, so a
+        bounded set of candidates is ranked with ``_search_rank``: the first
+        matches at the start of a field (FTS5 initial-token queries), which
+        include the exact matches, and the first matches anywhere.
         
+        ``conditions`` are attribute conditions from ``attribute_conditions``.
+        Returns None when the query is too short for trigrams or the index is
+        missing; callers then use ``_like_filter``.
+        """
+        if self._fts_available is None:
+            self._fts_available = session.exec(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'contacts_fts'")
+            ).first() is not None
+            
+        if not self._fts_available or len(query) < FTS_MIN_QUERY_LENGTH:
+            return None
+            
+        # Quoted as one FTS5 string, so the query matches as a substring
+        phrase = '"' + query.replace('"', '""') + '"'
+        base = select(
+            CONTACTS_FTS.c.rowid, CONTACTS_FTS.c.email, CONTACTS_FTS.c.first_name, CONTACTS_FTS.c.last_name
+        )
+        
+        # Scoped with EXISTS so the index drives the query
+        conditions = conditions or {}
+        if campaign_id is not None:
+            in_campaign = select(CampaignContact.contact_id).where(
+                CampaignContact.campaign_id == campaign_id,
+                CampaignContact.contact_id == CONTACTS_FTS.c.rowid,
+                *conditions.get(AttributeSource.CUSTOM_DATA, [])
+            )
+            if status:
+                in_campaign = in_campaign.where(CampaignContact.status == status)
+            base = base.where(in_campaign.exists())
+            
+        if conditions.get(AttributeSource.EXTRA_DATA):
+            base = base.where(
+                select(Contact.id).where(
+                    Contact.id == CONTACTS_FTS.c.rowid,
+                    *conditions[AttributeSource.EXTRA_DATA]
+                ).exists()
+            )
+            
+        candidates = {}
+        pool = max(limit, self.search_candidates)
+        for fts_query in ("^" + phrase, phrase):
+            matches = base.where(literal_column("contacts_fts").op("MATCH")(fts_query)).limit(pool)
+            for row in session.exec(matches):
+                candidates[row.rowid] = row
+                
+        ranked = sorted(
+            candidates.values(),
+            key=lambda row: (_search_rank(query, row.email, row.first_name, row.last_name), row.rowid)
+        )
+        return [row.rowid for row in ranked[:limit]]
+        
+    def _like_filter(self, query: str):
+        """Substring filter on email and names, for queries the index cannot serve."""
+        search_pattern = f"%{query.lower()}%"
+        return or_(
+            Contact.email.ilike(search_pattern),
+            Contact.first_name.ilike(search_pattern),
+            Contact.last_name.ilike(search_pattern)
+        )
+        
+    def index_attribute(self, name: str,
+                        source: AttributeSource = AttributeSource.EXTRA_DATA) -> IndexedAttribute:
+        """Declare a JSON attribute as indexed.
+        
+        Adds a virtual generated column over json_extract to the source table
+        and indexes it, so attribute predicates on it are answered from the
+        index. Declaring an attribute twice returns the existing declaration.
+        """
+        path = _attribute_path(name)
+        with write_scope() as session:
+            attribute = session.exec(
+                select(IndexedAttribute).where(
+                    IndexedAttribute.name == name,
+                    IndexedAttribute.source == source
+                )
+            ).first()
+            if attribute:
+                return attribute
+                
+            attribute = IndexedAttribute(name=name, source=source, column_name="")
+            session.add(attribute)
+            session.flush()
+            attribute.column_name = f"attr_{attribute.id}"
+            
+            table, json_column = ATTRIBUTE_SOURCES[source]
+            indexed_columns = attribute.column_name
+            if source == AttributeSource.CUSTOM_DATA:
+                # Filtered within one campaign and paged by contact_id
+                indexed_columns = f"campaign_id, {attribute.column_name}, contact_id"
+                
+            connection = session.connection()
+            # DDL takes no parameters: the path goes in as an escaped string literal
+            path_literal = path.replace("'", "''")
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {attribute.column_name} "
+                f"GENERATED ALWAYS AS (json_extract({json_column}, '{path_literal}')) VIRTUAL"
+            )
+            connection.exec_driver_sql(
+                f"CREATE INDEX ix_{table.name}_{attribute.column_name} "
+                f"ON {table.name} ({indexed_columns})"
+            )
+            # Without statistics the planner keeps driving from the campaign
+            connection.exec_driver_sql(f"ANALYZE {table.name}")
+            session.commit()
+            session.refresh(attribute)
+            
+            logger.info(f"Attribute indexed: {name} ({source.value}) as {table.name}.{attribute.column_name}")
+            return attribute
+            
+    def unindex_attribute(self, name: str,
+                          source: AttributeSource = AttributeSource.EXTRA_DATA) -> bool:
+        """Drop the generated column and index of an indexed attribute."""
+        with write_scope() as session:
+            attribute = session.exec(
+                select(IndexedAttribute).where(
+                    IndexedAttribute.name == name,
+                    IndexedAttribute.source == source
+                )
+            ).first()
+            if not attribute:
+                return False
+                
+            table, _ = ATTRIBUTE_SOURCES[source]
+            connection = session.connection()
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{table.name}_{attribute.column_name}")
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} DROP COLUMN {attribute.column_name}")
+            session.delete(attribute)
+            session.commit()
+            
+            logger.info(f"Attribute index dropped: {name} ({source.value})")
+            return True
+            
+    def get_indexed_attributes(self) -> List[IndexedAttribute]:
+        """Get the declared indexed attributes."""
+        with session_scope() as session:
+            return list(session.exec(
+                select(IndexedAttribute).order_by(IndexedAttribute.source, IndexedAttribute.name)
+            ).all())
+            
     def get_or_create_contact(self, email: str, first_name: str = None, last_name: str = None, 
                             extra_data: Dict[str, Any] = None) -> Contact:
         """Get existing contact or create new one."""
-        for session in get_session():
+        with write_scope() as session:
             # Try to find existing contact
             contact = session.exec(
                 select(Contact).where(Contact.email == email)
@@ -104,7 +322,7 @@ class ContactService:
     def add_contact_to_campaign(self, contact_id: int, campaign_id: int, 
                               custom_data: Dict[str, Any] = None) -> CampaignContact:
         """Add a contact to a campaign."""
-        for session in get_session():
+        with write_scope() as session:
             # Check if association already exists
             existing = session.exec(
                 select(CampaignContact).where(
@@ -137,105 +355,238 @@ class ContactService:
             
             return campaign_contact
             
-    def bulk_add_contacts_to_campaign(self, campaign_id: int, contacts_data: List[Dict[str, Any]], 
-                                    mode: MergeMode = MergeMode.REPLACE, user_id: int = None) -> Dict[str, int]:
-        """Bulk add contacts to a campaign."""
-        for session in get_session():
-            stats = {
-                "added": 0,
-                "updated": 0,
-                "skipped": 0,
-                "errors": 0
-            }
+    def bulk_add_contacts_to_campaign(self, campaign_id: int, contacts_data: Iterable[Dict[str, Any]], 
+                                    mode: MergeMode = MergeMode.REPLACE, user_id: int = None,
+                                    batch_size: int = None,
+                                    progress_callback: Callable[[int], None] = None) -> Dict[str, int]:
+        """Bulk add contacts to a campaign.
+        
+        Rows are processed in batches: existing contacts are resolved with one
+        ``IN`` lookup per batch, new rows are written with a single batched
+        ``INSERT ... ON CONFLICT`` statement and each batch is committed once.
+        """
+        batch_size = batch_size or self.bulk_batch_size
+        
+        return self.bulk_add_contact_batches(
+            campaign_id=campaign_id,
+            batches=_rows_to_batches(contacts_data, batch_size),
+            mode=mode,
+            user_id=user_id,
+            progress_callback=progress_callback
+        )
+        
+    def bulk_add_contact_batches(self, campaign_id: int, batches: Iterable[ContactBatch],
+                                 mode: MergeMode = MergeMode.REPLACE, user_id: int = None,
+                                 progress_callback: Callable[[int], None] = None) -> Dict[str, int]:
+        """Bulk add contacts to a campaign from an iterable of column batches.
+        
+        Batches must already be normalized and de-duplicated (see
+        ``ContactBatch``). Each one is upserted and committed as one
+        transaction, and ``progress_callback`` is called after every commit
+        with the number of contacts processed so far. Batches are pulled
+        lazily, so a streaming reader only ever holds one batch in memory.
+        The writer is only held while a batch is written, so other writes
+        interleave with a long import, and batches are written with the
+        bulk_import PRAGMA profile. In replace mode the existing contacts are
+        removed in the transaction of the first batch written, so a reader
+        that fails before then leaves the campaign as it was.
+        """
+        mode = MergeMode(mode)
+        
+        stats = {
+            "added": 0,
+            "updated": 0,
+            "skipped": 0,
+            "errors": 0
+        }
+        
+        # Replace mode clears the campaign together with the first batch
+        replace_pending = mode == MergeMode.REPLACE
+        processed = 0
+        
+        for batch in batches:
+            # Rows dropped upstream while cleaning the batch
+            stats["skipped"] += batch.skipped
+            stats["errors"] += batch.errors
             
-            # If replace mode, clear existing contacts
-            if mode == MergeMode.REPLACE:
-                existing_count = session.exec(
-                    select(func.count(CampaignContact.contact_id)).where(
-                        CampaignContact.campaign_id == campaign_id
-                    )
-                ).first()
-                
-                session.exec(
-                    select(CampaignContact).where(CampaignContact.campaign_id == campaign_id)
-                ).delete()
-                
-                logger.info(f"Removed {existing_count} existing contacts from campaign {campaign_id}")
-                
-            # Process each contact
-            for contact_data in contacts_data:
-                try:
-                    email = contact_data.get("email", "").strip().lower()
-                    if not email:
-                        stats["errors"] += 1
-                        continue
+            if len(batch):
+                with write_scope(profile="bulk_import") as session:
+                    if self._upsert_contact_batch(session, campaign_id, batch, stats, replace_pending):
+                        replace_pending = False
                         
-                    first_name = contact_data.get("first_name", "").strip()
-                    last_name = contact_data.get("last_name", "").strip()
+            processed += len(batch) + batch.skipped + batch.errors
+            
+            if progress_callback:
+                try:
+                    progress_callback(processed)
+                except Exception as e:
+                    logger.error(f"Progress callback error: {e}")
                     
-                    # Extract extra data (exclude standard fields)
-                    extra_data = {k: v for k, v in contact_data.items() 
-                                if k not in ["email", "first_name", "last_name"]}
+        # Nothing was written, but the whole file was read: still replace
+        if replace_pending:
+            with write_scope() as session:
+                self._clear_campaign_contacts(session, campaign_id)
+                
+        # Campaign contact count is kept up to date by database triggers
+        with session_scope() as session:
+            campaign = session.get(Campaign, campaign_id)
+            total_contacts = campaign.contact_count if campaign else 0
+            
+        # Log the action
+        if user_id:
+            self.audit_service.log_campaign_action(
+                action="CONTACTS_IMPORTED",
+                campaign_id=campaign_id,
+                user_id=user_id,
+                details={
+                    "mode": mode.value,
+                    "stats": stats,
+                    "total_contacts": total_contacts
+                }
+            )
+            
+        logger.info(f"Bulk import completed for campaign {campaign_id}: {stats}")
+        return stats
+            
+    def _clear_campaign_contacts(self, session: Session, campaign_id: int) -> None:
+        """Remove every contact from a campaign, in the caller's transaction."""
+        result = session.exec(
+            delete(CampaignContact).where(CampaignContact.campaign_id == campaign_id)
+        )
+        logger.info(f"Removed {result.rowcount} existing contacts from campaign {campaign_id}")
+        
+    def _upsert_contact_batch(self, session: Session, campaign_id: int, batch: ContactBatch,
+                              stats: Dict[str, int], replace: bool = False) -> bool:
+        """Upsert one batch of contacts and their campaign associations in a single transaction.
+        
+        With ``replace`` the campaign's existing contacts are removed first, in
+        the same transaction. Returns False when the batch was rolled back.
+        """
+        now = datetime.utcnow()
+        
+        try:
+            if replace:
+                self._clear_campaign_contacts(session, campaign_id)
+                
+            # Resolve existing contacts with one lookup for the whole batch
+            existing = {
+                row.email: row
+                for row in session.exec(
+                    select(Contact.id, Contact.email, Contact.first_name,
+                           Contact.last_name, Contact.extra_data)
+                    .where(Contact.email.in_(batch.emails))
+                )
+            }
+            
+            new_contacts = []
+            changed_contacts = []
+            for email, first_name, last_name, extra_data in zip(
+                batch.emails, batch.first_names, batch.last_names, batch.extra_data
+            ):
+                current = existing.get(email)
+                if current is None:
+                    new_contacts.append({
+                        "email": email,
+                        "first_name": first_name,
+                        "last_name": last_name,
+                        "extra_data": extra_data,
+                        "created_at": now,
+                        "updated_at": now
+                    })
+                    continue
                     
-                    # Get or create contact
-                    contact = self.get_or_create_contact(
-                        email=email,
-                        first_name=first_name,
-                        last_name=last_name,
-                        extra_data=extra_data if extra_data else None
-                    )
+                # Only touch existing contacts whose provided data actually changed
+                changes = {}
+                if first_name and current.first_name != first_name:
+                    changes["first_name"] = first_name
+                if last_name and current.last_name != last_name:
+                    changes["last_name"] = last_name
+                if extra_data and current.extra_data != extra_data:
+                    changes["extra_data"] = extra_data
+                if changes:
+                    changed_contacts.append({"id": current.id, "updated_at": now, **changes})
                     
-                    # Add to campaign
-                    campaign_contact = self.add_contact_to_campaign(
-                        contact_id=contact.id,
-                        campaign_id=campaign_id,
-                        custom_data=extra_data if extra_data else None
+            if new_contacts:
+                session.exec(
+                    sqlite_insert(Contact).on_conflict_do_nothing(index_elements=["email"]),
+                    params=new_contacts
+                )
+                
+            if changed_contacts:
+                session.exec(update(Contact), params=changed_contacts)
+                
+            contact_ids = dict(
+                session.exec(
+                    select(Contact.email, Contact.id).where(Contact.email.in_(batch.emails))
+                ).all()
+            )
+            
+            # Resolve existing campaign associations for this batch
+            associated = set(
+                session.exec(
+                    select(CampaignContact.contact_id).where(
+                        and_(
+                            CampaignContact.campaign_id == campaign_id,
+                            CampaignContact.contact_id.in_(list(contact_ids.values()))
+                        )
                     )
+                ).all()
+            )
+            
+            new_links = []
+            updated_links = []
+            for email, custom_data in zip(batch.emails, batch.extra_data):
+                contact_id = contact_ids.get(email)
+                if contact_id is None:
+                    continue
+                if contact_id in associated:
+                    if custom_data:
+                        updated_links.append({
+                            "campaign_id": campaign_id,
+                            "contact_id": contact_id,
+                            "custom_data": custom_data,
+                            "updated_at": now
+                        })
+                else:
+                    new_links.append({
+                        "campaign_id": campaign_id,
+                        "contact_id": contact_id,
+                        "status": ContactStatus.PENDING,
+                        "retry_count": 0,
+                        "custom_data": custom_data,
+                        "created_at": now,
+                        "updated_at": now
+                    })
                     
-                    if campaign_contact:
-                        stats["added"] += 1
-                    else:
-                        stats["updated"] += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error processing contact {contact_data}: {e}")
-                    stats["errors"] += 1
-                    
-            # Update campaign contact count
-            total_contacts = session.exec(
-                select(func.count(CampaignContact.contact_id)).where(
-                    CampaignContact.campaign_id == campaign_id
+            if new_links:
+                session.exec(
+                    sqlite_insert(CampaignContact).on_conflict_do_nothing(
+                        index_elements=["campaign_id", "contact_id"]
+                    ),
+                    params=new_links
                 )
-            ).first()
-            
-            campaign = session.get(Campaign, campaign_id)
-            if campaign:
-                campaign.contact_count = total_contacts
-                session.add(campaign)
+                
+            if updated_links:
+                session.exec(update(CampaignContact), params=updated_links)
                 
             session.commit()
             
-            # Log the action
-            if user_id:
-                self.audit_service.log_campaign_action(
-                    action="CONTACTS_IMPORTED",
-                    campaign_id=campaign_id,
-                    user_id=user_id,
-                    details={
-                        "mode": mode.value,
-                        "stats": stats,
-                        "total_contacts": total_contacts
-                    }
-                )
-                
-            logger.info(f"Bulk import completed for campaign {campaign_id}: {stats}")
-            return stats
+            stats["added"] += len(new_links)
+            stats["updated"] += len(contact_ids) - len(new_links)
+            stats["errors"] += len(batch) - len(contact_ids)
+            return True
+            
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error processing contact batch of {len(batch)} rows for campaign {campaign_id}: {e}")
+            stats["errors"] += len(batch)
+            return False
             
     def update_contact_status(self, campaign_id: int, contact_id: int, 
                             status: ContactStatus, user_id: int = None,
                             error_message: str = None) -> bool:
         """Update contact status in a campaign."""
-        for session in get_session():
+        with write_scope() as session:
             campaign_contact = session.exec(
                 select(CampaignContact).where(
                     and_(
@@ -253,7 +604,6 @@ class ContactService:
             campaign_contact.status = status
             
             # Update timestamps based on status
-            from datetime import datetime
             now = datetime.utcnow()
             
             if status == ContactStatus.SENT:
@@ -290,9 +640,19 @@ class ContactService:
             return True
             
     def search_contacts(self, campaign_id: int, query: str = None, 
-                       status: ContactStatus = None, limit: int = 100) -> List[Dict[str, Any]]:
-        """Search contacts in a campaign."""
-        for session in get_session():
+                       status: ContactStatus = None, limit: int = 100,
+                       attributes: Dict[str, Any] = None,
+                       custom_attributes: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Search contacts in a campaign.
+        
+        ``attributes`` and ``custom_attributes`` are predicates on extra_data
+        and custom_data attributes, as in a wave's filter criteria.
+        """
+        with session_scope() as session:
+            conditions = attribute_conditions(
+                session, {"attributes": attributes, "custom_attributes": custom_attributes}
+            )
+            
             # Build base query
             base_query = select(
                 Contact, CampaignContact
@@ -302,23 +662,46 @@ class ContactService:
                 CampaignContact.campaign_id == campaign_id
             )
             
-            # Add search filter
+            # Add search filter; small campaigns are quicker to scan than to match
+            candidates = limit
             if query:
-                search_filter = or_(
-                    Contact.email.contains(query),
-                    Contact.first_name.contains(query),
-                    Contact.last_name.contains(query)
-                )
-                base_query = base_query.where(search_filter)
-                
-            # Add status filter
+                campaign = session.get(Campaign, campaign_id)
+                large_campaign = campaign and campaign.contact_count > self.search_scan_max_contacts
+                contact_ids = None
+                if large_campaign:
+                    contact_ids = self._search_contact_ids(
+                        session, query, limit, campaign_id, status, conditions
+                    )
+                    
+                if contact_ids is None:
+                    base_query = base_query.where(self._like_filter(query))
+                    if large_campaign:
+                        # Too short for the index: rank a bounded set of scanned matches
+                        candidates = max(limit, self.search_candidates)
+                    else:
+                        # Small campaigns: best matches first, then limit
+                        base_query = base_query.order_by(
+                            _match_kind(query, Contact.email, Contact.first_name, Contact.last_name), Contact.id
+                        )
+                else:
+                    base_query = base_query.where(Contact.id.in_(contact_ids))
+                    
+            # Add status and attribute filters
             if status:
                 base_query = base_query.where(CampaignContact.status == status)
+            for source_conditions in conditions.values():
+                base_query = base_query.where(*source_conditions)
                 
-            # Add limit
-            base_query = base_query.limit(limit)
+            base_query = base_query.limit(candidates)
             
             results = session.exec(base_query).all()
+            if query:
+                results = sorted(
+                    results,
+                    key=lambda row: (
+                        _search_rank(query, row[0].email, row[0].first_name, row[0].last_name), row[0].id
+                    )
+                )[:limit]
             
             # Format results
             contacts = []
@@ -339,33 +722,248 @@ class ContactService:
                 
             return contacts
             
-    def get_campaign_contact_stats(self, campaign_id: int) -> Dict[str, int]:
-        """Get contact statistics for a campaign."""
-        for session in get_session():
-            stats = {}
+    def list_campaign_contacts(self, campaign_id: int, after_contact_id: int = None,
+                               limit: int = 25, status: ContactStatus = None,
+                               include_data: bool = True, with_total: bool = False) -> Dict[str, Any]:
+        """Get one page of a campaign's contacts, in contact ID order.
+        
+        Pages are keyset-based: pass a page's ``next_cursor`` as
+        ``after_contact_id`` to get the next one, at the same cost however
+        deep it is. ``include_data=False`` leaves out the extra_data and
+        custom_data JSON. ``with_total`` adds the number of matching
+        contacts, read from the campaign counters rather than counted.
+        """
+        status = ContactStatus(status) if status else None
+        limit = max(1, min(limit, self.max_page_size))
+        
+        columns = [
+            Contact.id, Contact.email, Contact.first_name, Contact.last_name,
+            CampaignContact.status, CampaignContact.sent_at, CampaignContact.opened_at,
+            CampaignContact.responded_at, CampaignContact.error_message
+        ]
+        if include_data:
+            columns += [Contact.extra_data, CampaignContact.custom_data]
             
-            # Count by status
-            for status in ContactStatus:
-                count = session.exec(
-                    select(func.count(CampaignContact.contact_id)).where(
-                        and_(
-                            CampaignContact.campaign_id == campaign_id,
-                            CampaignContact.status == status
-                        )
-                    )
-                ).first() or 0
+        with session_scope() as session:
+            page_query = select(*columns).select_from(CampaignContact).join(
+                Contact, Contact.id == CampaignContact.contact_id
+            ).where(
+                CampaignContact.campaign_id == campaign_id
+            )
+            
+            if after_contact_id:
+                page_query = page_query.where(CampaignContact.contact_id > after_contact_id)
+            if status:
+                page_query = page_query.where(CampaignContact.status == status)
                 
-                stats[status.value.lower() + "_count"] = count
+            # One extra row tells whether there is a next page
+            rows = session.exec(
+                page_query.order_by(CampaignContact.contact_id).limit(limit + 1)
+            ).all()
+            
+            page = {
+                "contacts": [self._format_contact_row(row, include_data) for row in rows[:limit]],
+                "next_cursor": rows[limit - 1].id if len(rows) > limit else None
+            }
+            
+            if with_total:
+                campaign = session.get(Campaign, campaign_id)
+                stats = counter_contact_stats(campaign) if campaign else {}
+                key = f"{status.value.lower()}_count" if status else "total_count"
+                page["total"] = stats.get(key, 0)
                 
-            # Calculate total
-            stats["total_count"] = sum(stats.values())
+            return page
+            
+    def _format_contact_row(self, row, include_data: bool) -> Dict[str, Any]:
+        """Format a projected contact row like search_contacts results."""
+        contact = {
+            "id": row.id,
+            "email": row.email,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "status": row.status.value,
+            "sent_at": row.sent_at.isoformat() if row.sent_at else None,
+            "opened_at": row.opened_at.isoformat() if row.opened_at else None,
+            "responded_at": row.responded_at.isoformat() if row.responded_at else None,
+            "error_message": row.error_message
+        }
+        if include_data:
+            contact["extra_data"] = row.extra_data
+            contact["custom_data"] = row.custom_data
+        return contact
+        
+    def get_campaign_contact_stats(self, campaign_id: int) -> Dict[str, int]:
+        """Get contact statistics for a campaign."""
+        return self.get_campaigns_contact_stats([campaign_id])[campaign_id]
+        
+    def get_campaigns_contact_stats(self, campaign_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Get contact statistics for several campaigns with one GROUP BY query."""
+        campaign_ids = list(campaign_ids)
+        all_stats = {
+            campaign_id: {status.value.lower() + "_count": 0 for status in ContactStatus}
+            for campaign_id in campaign_ids
+        }
+        if not campaign_ids:
+            return all_stats
             
-            # Calculate response rate
-            if stats["sent_count"] > 0:
-                stats["response_rate"] = round(
-                    (stats["responded_count"] / stats["sent_count"]) * 100, 2
+        with session_scope() as session:
+            # Count by campaign and status
+            rows = session.exec(
+                select(
+                    CampaignContact.campaign_id,
+                    CampaignContact.status,
+                    func.count(CampaignContact.contact_id)
+                ).where(
+                    CampaignContact.campaign_id.in_(campaign_ids)
+                ).group_by(
+                    CampaignContact.campaign_id, CampaignContact.status
                 )
+            ).all()
+            
+        for campaign_id, status, count in rows:
+            all_stats[campaign_id][status.value.lower() + "_count"] = count
+            
+        return {
+            campaign_id: summarize_contact_stats(stats)
+            for campaign_id, stats in all_stats.items()
+        }
+
+
+
+def counter_contact_stats(campaign: Campaign) -> Dict[str, Any]:
+    """Per-status contact counts of a campaign, read from its counters."""
+    tracked = {
+        "sent_count": campaign.sent_count,
+        "opened_count": campaign.opened_count,
+        "responded_count": campaign.responded_count,
+        "bounced_count": campaign.bounced_count,
+        "optout_count": campaign.opted_out_count,
+        "error_count": campaign.error_count
+    }
+    return summarize_contact_stats({
+        "pending_count": campaign.contact_count - sum(tracked.values()),
+        **tracked
+    })
+
+
+def summarize_contact_stats(stats: Dict[str, int]) -> Dict[str, Any]:
+    """Add the total and the response rate to per-status contact counts."""
+    stats = dict(stats)
+    
+    # Calculate total
+    stats["total_count"] = sum(stats.values())
+    
+    # Calculate response rate
+    if stats["sent_count"] > 0:
+        stats["response_rate"] = round(
+            (stats["responded_count"] / stats["sent_count"]) * 100, 2
+        )
+    else:
+        stats["response_rate"] = 0.0
+        
+    return stats
+
+
+def attribute_conditions(session: Session, criteria: Optional[Dict[str, Any]]) -> Dict[AttributeSource, List]:
+    """SQL conditions for the attribute predicates in ``criteria``, by source.
+    
+    ``criteria["attributes"]`` holds extra_data predicates and
+    ``criteria["custom_attributes"]`` custom_data ones, as ``{name: value}``.
+    A list value matches any of its items and None matches a missing
+    attribute. Indexed attributes are compared through their generated
+    column, others through json_extract.
+    """
+    conditions = {}
+    if not criteria:
+        return conditions
+        
+    indexed = None
+    for key, source in ATTRIBUTE_CRITERIA_KEYS.items():
+        predicates = criteria.get(key)
+        if not predicates:
+            continue
+            
+        if indexed is None:
+            indexed = {
+                (attribute.name, attribute.source): attribute.column_name
+                for attribute in session.exec(select(IndexedAttribute)).all()
+            }
+            
+        table, json_column = ATTRIBUTE_SOURCES[source]
+        for name, value in predicates.items():
+            column_name = indexed.get((name, source))
+            if column_name:
+                target = literal_column(f"{table.name}.{column_name}")
             else:
-                stats["response_rate"] = 0.0
+                target = func.json_extract(table.c[json_column], _attribute_path(name))
                 
-            return stats
\ No newline at end of file
+            if value is None:
+                condition = target.is_(None)
+            elif isinstance(value, (list, tuple)):
+                condition = target.in_(value)
+            else:
+                condition = target == value
+            conditions.setdefault(source, []).append(condition)
+            
+    return conditions
+
+
+def _attribute_path(name: str) -> str:
+    """JSON path of a top-level attribute, quoted so any key but one with a double quote works."""
+    if not name or '"' in name or any(ord(char) < 32 for char in name):
+        raise ValueError(f"Invalid attribute name: {name!r}")
+    return f'$."{name}"'
+
+
+def _match_kind(query: str, *columns):
+    """SQL counterpart of _search_rank's first key: 0 exact field match, 1 prefix, 2 other."""
+    query = query.lower()
+    return case(
+        (or_(*(func.lower(column) == query for column in columns)), 0),
+        (or_(*(func.lower(column).startswith(query, autoescape=True) for column in columns)), 1),
+        else_=2
+    )
+
+
+def _search_rank(query: str, *values: Optional[str]) -> Tuple[int, int]:
+    """Sort key for a search hit: exact field matches first, then prefixes, then shorter fields."""
+    query = query.lower()
+    best = (3, 0)
+    for value in values:
+        value = (value or "").lower()
+        if query in value:
+            kind = 0 if value == query else 1 if value.startswith(query) else 2
+            best = min(best, (kind, len(value)))
+    return best
+
+
+def _rows_to_batches(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[ContactBatch]:
+    """Normalize contact dicts into de-duplicated column batches of at most ``size`` contacts."""
+    seen_emails = set()
+    batch = ContactBatch()
+    
+    for row in rows:
+        email = str(row.get("email") or "").strip().lower()
+        if not EMAIL_PATTERN.match(email):
+            batch.errors += 1
+            continue
+            
+        # Keep the first occurrence of each email, like get_or_create would
+        if email in seen_emails:
+            batch.skipped += 1
+            continue
+        seen_emails.add(email)
+        
+        extra_data = {k: v for k, v in row.items() if k not in STANDARD_CONTACT_FIELDS}
+        
+        batch.emails.append(email)
+        batch.first_names.append(str(row.get("first_name") or "").strip())
+        batch.last_names.append(str(row.get("last_name") or "").strip())
+        batch.extra_data.append(extra_data or None)
+        
+        if len(batch) >= size:
+            yield batch
+            batch = ContactBatch()
+            
+    if len(batch) or batch.skipped or batch.errors:
+        yield batch
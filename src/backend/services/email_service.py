@@ -1,23 +1,41 @@
+import atexit
+import heapq
+import json
 import logging
+import os
+import random
+import re
 import time
 import threading
-from datetime import datetime
-from typing import List, Optional, Dict, Any, Callable
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Callable, Iterable, Set, Tuple
 from queue import Queue, Empty
-from dataclasses import dataclass
+from dataclasses import dataclass, field, asdict
 from enum import Enum
+from functools import lru_cache
 
+from sqlalchemy import bindparam, delete, func, insert, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select, and_
 
-from ..database import get_session
-from ..models.email import EmailTemplate, SendWave, MailLog, WaveType, WaveStatus, MailStatus
-from ..models.contact import Contact, CampaignContact, ContactStatus
+from ..database import get_database, session_scope, write_scope
+from ..models.email import EmailTemplate, SendWave, MailLog, SendOutbox, WaveType, WaveStatus, MailStatus
+from ..models.contact import Contact, CampaignContact, ContactStatus, AttributeSource, IndexedAttribute
 from ..providers.base import IMailProvider, EmailMessage, SendResult, SendStatus
 from ..providers.outlook_provider import OutlookCOMProvider
 from .audit_service import AuditService
+from .contact_service import attribute_conditions
 
 logger = logging.getLogger(__name__)
 
+# "{name}" placeholders; CSS blocks such as "{ color: red; }" are not matched
+PLACEHOLDER_PATTERN = re.compile(r"\{([^{}:;\r\n]+)\}")
+
+# Variables available for every contact, on top of extra_data and custom_data
+STANDARD_VARIABLES = ("first_name", "last_name", "email", "full_name")
+
 
 @dataclass
 class EmailQueueItem:
@@ -27,67 +45,524 @@ class EmailQueueItem:
     template_id: int
     email_data: Dict[str, Any]
     retry_count: int = 0
+    outbox_id: Optional[int] = None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per ``per_seconds``."""
+    
+    def __init__(self, rate: int, per_seconds: float = 60, burst: int = None):
+        self.capacity = float(burst or rate)
+        self.fill_rate = rate / per_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        
+    def take(self) -> float:
+        """Take a token if one is available.
+        
+        Returns 0.0 when a token was taken, otherwise the number of seconds
+        until the next token is due.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+        
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+            
+        return (1.0 - self.tokens) / self.fill_rate
+        
+    def time_until_next_token(self) -> float:
+        now = time.monotonic()
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        return 0.0 if tokens >= 1.0 else (1.0 - tokens) / self.fill_rate
 
 
 class RateLimiter:
-    """Rate limiter for email sending."""
+    """Token-bucket rate limiter for email sending.
     
-    def __init__(self, rate: int, per_seconds: int = 60):
+    Each sender gets its own bucket, created on first use with the default
+    rate and burst unless ``sender_limits`` overrides them. Acquiring is O(1)
+    and a blocking ``acquire`` sleeps exactly until the next token is due.
+    """
+    
+    def __init__(self, rate: int, per_seconds: int = 60, burst: int = None,
+                 sender_limits: Dict[str, Dict[str, Any]] = None):
         self.rate = rate
         self.per_seconds = per_seconds
-        self.calls = []
+        self.burst = burst
+        self.sender_limits = {
+            sender.lower(): limits for sender, limits in (sender_limits or {}).items()
+        }
+        self.buckets: Dict[Optional[str], TokenBucket] = {}
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self._interrupted = False
+        
+    @classmethod
+    def from_config(cls, throttle_config: Dict[str, Any]) -> "RateLimiter":
+        """Build a limiter from the ``email.throttle`` section of config.yaml."""
+        return cls(
+            rate=throttle_config.get("rate", 30),
+            per_seconds=60 if throttle_config.get("per_minute", True) else 1,
+            burst=throttle_config.get("burst"),
+            sender_limits=throttle_config.get("senders")
+        )
+        
+    def _bucket(self, sender: Optional[str]) -> TokenBucket:
+        key = sender.lower() if sender else None
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limits = self.sender_limits.get(key, {})
+            bucket = TokenBucket(
+                rate=limits.get("rate", self.rate),
+                per_seconds=self.per_seconds,
+                burst=limits.get("burst", self.burst)
+            )
+            self.buckets[key] = bucket
+        return bucket
+        
+    def acquire(self, timeout: Optional[float] = 0.0, sender: str = None) -> bool:
+        """Acquire a send slot.
+        
+        With the default ``timeout`` of 0 this only tries once; otherwise it
+        waits up to ``timeout`` seconds (forever if None) for the next token.
+        Returns False on timeout or when waiters are interrupted.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        with self.condition:
+            bucket = self._bucket(sender)
+            while True:
+                wait = bucket.take()
+                if wait == 0.0:
+                    return True
+                    
+                if self._interrupted:
+                    return False
+                    
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                    
+                self.condition.wait(wait)
+                
+    def time_until_next_slot(self, sender: str = None) -> float:
+        """Get time in seconds until next slot is available."""
+        with self.lock:
+            return self._bucket(sender).time_until_next_token()
+            
+    def interrupt(self):
+        """Wake up blocked callers and make them return False."""
+        with self.condition:
+            self._interrupted = True
+            self.condition.notify_all()
+            
+    def reset(self):
+        """Allow blocking acquires again after an interrupt."""
+        with self.condition:
+            self._interrupted = False
+
+
+class RetryScheduler:
+    """Emails waiting for a retry, kept in a min-heap by due time.
+    
+    The send workers poll it with ``pop_due`` instead of running one timer
+    thread per failed email.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, EmailQueueItem]] = []
+        self._counter = 0
         self.lock = threading.Lock()
         
-    def acquire(self) -> bool:
-        """Try to acquire a rate limit slot."""
+    def schedule(self, item: EmailQueueItem, delay: float):
+        """Make an item due again in ``delay`` seconds."""
         with self.lock:
-            now = time.time()
+            self._counter += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, item))
             
-            # Remove old calls
-            self.calls = [call_time for call_time in self.calls 
-                         if now - call_time < self.per_seconds]
+    def pop_due(self) -> Optional[EmailQueueItem]:
+        """Remove and return the earliest item whose due time has passed."""
+        with self.lock:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+        return None
+        
+    def time_until_next(self) -> Optional[float]:
+        """Seconds until the next retry is due, None when nothing is scheduled."""
+        with self.lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
             
-            # Check if we can make another call
-            if len(self.calls) < self.rate:
-                self.calls.append(now)
-                return True
+    def next_due_at(self) -> Optional[datetime]:
+        """Wall-clock time of the next retry."""
+        wait = self.time_until_next()
+        return datetime.utcnow() + timedelta(seconds=wait) if wait is not None else None
+        
+    def clear(self):
+        with self.lock:
+            self._heap = []
+            
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._heap)
+
+
+@dataclass
+class SendRecord:
+    """Outcome of one send attempt, waiting to be written to the database."""
+    wave_id: int
+    campaign_id: int
+    contact_id: int
+    template_id: Optional[int]
+    status: MailStatus
+    retry_count: int = 0
+    error_message: Optional[str] = None
+    subject_sent: Optional[str] = None
+    body_sent: Optional[str] = None
+    outlook_message_id: Optional[str] = None
+    sent_at: datetime = field(default_factory=datetime.utcnow)
+    
+    # Outbox row of the email; retry_at is set when another attempt is due
+    outbox_id: Optional[int] = None
+    retry_at: Optional[datetime] = None
+    
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["status"] = self.status.value
+        data["sent_at"] = self.sent_at.isoformat()
+        data["retry_at"] = self.retry_at.isoformat() if self.retry_at else None
+        return json.dumps(data)
+        
+    @classmethod
+    def from_json(cls, line: str) -> "SendRecord":
+        data = json.loads(line)
+        data["status"] = MailStatus(data["status"])
+        data["sent_at"] = datetime.fromisoformat(data["sent_at"])
+        if data.get("retry_at"):
+            data["retry_at"] = datetime.fromisoformat(data["retry_at"])
+        return cls(**data)
+
+
+class SendResultBuffer:
+    """Write-behind buffer for send results.
+    
+    Records are appended to a journal file as they arrive and handed to
+    ``writer`` in one batch every ``max_items`` records or ``max_delay``
+    seconds. The journal is only truncated after the writer succeeds, so
+    results buffered when the process dies are replayed by ``recover``.
+    """
+    
+    def __init__(self, writer: Callable[[List[SendRecord], bool], None],
+                 max_items: int = 50, max_delay: float = 0.5,
+                 journal_path: Optional[str] = None):
+        self.writer = writer
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.journal_path = journal_path
+        
+        self.records: List[SendRecord] = []
+        self.lock = threading.RLock()
+        
+        # Buffered records per wave and status, for live progress
+        self._pending_counts: Dict[int, Dict[MailStatus, int]] = {}
+        self._journal = None
+        self._oldest = None
+        self._stop = threading.Event()
+        self._flusher = None
+        
+    def add(self, record: SendRecord):
+        """Buffer a record, flushing when the buffer is full."""
+        with self.lock:
+            if self.journal_path:
+                if self._journal is None:
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                self._journal.write(record.to_json() + "\n")
+                self._journal.flush()
                 
-            return False
+            if not self.records:
+                self._oldest = time.monotonic()
+            self.records.append(record)
+            self._count(record)
             
-    def time_until_next_slot(self) -> float:
-        """Get time in seconds until next slot is available."""
+            if len(self.records) >= self.max_items:
+                self.flush()
+                
+    def flush(self) -> int:
+        """Write all buffered records; they stay buffered if the write fails."""
         with self.lock:
-            if len(self.calls) < self.rate:
-                return 0.0
+            return self._flush(skip_existing=False)
+            
+    def recover(self) -> int:
+        """Write records left in the journal by a previous run."""
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return 0
+            
+        with self.lock:
+            with open(self.journal_path, encoding="utf-8") as journal:
+                records = [SendRecord.from_json(line) for line in journal if line.strip()]
                 
-            oldest_call = min(self.calls)
-            return self.per_seconds - (time.time() - oldest_call)
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            if not records:
+                return 0
+                
+            logger.warning(f"Recovering {len(records)} unrecorded send results")
+            self.records = records + self.records
+            self._recount()
+            
+            # The previous run may have committed some of these before dying
+            return self._flush(skip_existing=True)
+            
+    def _flush(self, skip_existing: bool) -> int:
+        if not self.records:
+            return 0
+            
+        records = self.records
+        try:
+            self.writer(records, skip_existing)
+        except IntegrityError:
+            # One duplicate must not block the others: write them one by one
+            if not self._write_each(records, skip_existing):
+                return 0
+        except Exception as e:
+            # Anything else may be transient: keep everything, journal included
+            logger.error(f"Failed to flush {len(records)} send results, will retry: {e}")
+            return 0
+            
+        self.records = []
+        self._pending_counts = {}
+        self._oldest = None
+        if self._journal:
+            self._journal.seek(0)
+            self._journal.truncate()
+            
+        return len(records)
+        
+    def _write_each(self, records: List[SendRecord], skip_existing: bool) -> bool:
+        """Write records individually, dropping those that violate a constraint.
+        
+        Any other error stops the pass; the records from there on are kept
+        for the next flush.
+        """
+        for index, record in enumerate(records):
+            try:
+                self.writer([record], skip_existing)
+            except IntegrityError as e:
+                logger.error(
+                    f"Dropping send result for contact {record.contact_id} "
+                    f"in wave {record.wave_id}: {e}"
+                )
+            except Exception as e:
+                logger.error(f"Failed to flush send results, will retry: {e}")
+                self.records = records[index:]
+                self._recount()
+                return False
+        return True
+        
+    def pending_counts(self, wave_id: int) -> Dict[MailStatus, int]:
+        """Records of a wave not written yet, by status."""
+        with self.lock:
+            return dict(self._pending_counts.get(wave_id, {}))
+            
+    def _count(self, record: SendRecord):
+        counts = self._pending_counts.setdefault(record.wave_id, {})
+        counts[record.status] = counts.get(record.status, 0) + 1
+        
+    def _recount(self):
+        self._pending_counts = {}
+        for record in self.records:
+            self._count(record)
+        
+    def start(self):
+        """Start the background thread that flushes results older than max_delay."""
+        if self._flusher and self._flusher.is_alive():
+            return
+            
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        
+    def stop(self):
+        """Stop the background flusher and write everything still buffered."""
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join(timeout=self.max_delay * 4)
+        self.flush()
+        
+    def _flush_loop(self):
+        while not self._stop.wait(self.max_delay / 2):
+            with self.lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+            if due:
+                self.flush()
+
+
+class CompiledText:
+    """Template text parsed once into literal and placeholder segments."""
+    
+    def __init__(self, text: str):
+        parts = PLACEHOLDER_PATTERN.split(text)
+        self.literals = parts[0::2]
+        self.placeholders = parts[1::2]
+        
+    def render(self, variables: Dict[str, str]) -> str:
+        """Render the text with a single join; unknown placeholders are kept as-is."""
+        parts = [self.literals[0]]
+        for name, literal in zip(self.placeholders, self.literals[1:]):
+            value = variables.get(name)
+            parts.append(f"{{{name}}}" if value is None else value)
+            parts.append(literal)
+        return "".join(parts)
+
+
+@dataclass
+class CompiledTemplate:
+    """Compiled subject and body of an EmailTemplate."""
+    template_id: Optional[int]
+    updated_at: Optional[datetime]
+    subject: CompiledText
+    body: CompiledText
+    # Reported when this version of the template is compiled
+    unknown_placeholders: Set[str]
+    
+    @classmethod
+    def compile(cls, template: EmailTemplate, known_variables: Iterable[str] = ()) -> "CompiledTemplate":
+        """Compile a template and report placeholders no variable is declared for."""
+        subject = CompiledText(template.subject)
+        body = CompiledText(template.body)
+        
+        known = set(STANDARD_VARIABLES) | set(template.variables or {}) | set(known_variables)
+        unknown = (set(subject.placeholders) | set(body.placeholders)) - known
+        
+        # Contact data may still fill them; templates not saved yet are only previewed
+        if unknown:
+            logger.log(
+                logging.WARNING if template.id is not None else logging.DEBUG,
+                f"Template {template.id} uses undeclared placeholders: {', '.join(sorted(unknown))}"
+            )
+            
+        return cls(
+            template_id=template.id,
+            updated_at=template.updated_at,
+            subject=subject,
+            body=body,
+            unknown_placeholders=unknown
+        )
+        
+    def render(self, contact_data: Dict[str, Any]) -> Tuple[str, str]:
+        """Render subject and body for one contact."""
+        variables = build_template_variables(contact_data)
+        return self.subject.render(variables), self.body.render(variables)
+
+
+def build_template_variables(contact_data: Dict[str, Any]) -> Dict[str, str]:
+    """Build the substitution values for one contact."""
+    first_name = contact_data.get('first_name') or ''
+    last_name = contact_data.get('last_name') or ''
+    
+    # Standard variables
+    standard_vars = {
+        'first_name': first_name,
+        'last_name': last_name,
+        'email': contact_data.get('email') or '',
+        'full_name': f"{first_name} {last_name}".strip()
+    }
+    
+    # Add extra data variables
+    extra_data = contact_data.get('extra_data', {}) or {}
+    custom_data = contact_data.get('custom_data', {}) or {}
+    
+    all_vars = {**standard_vars, **extra_data, **custom_data}
+    return {
+        name: str(value) if value is not None else ''
+        for name, value in all_vars.items()
+    }
+
+
+@dataclass
+class WaveContext:
+    """Data that stays constant while a wave is being sent, loaded once per wave."""
+    wave_id: int
+    campaign_id: int
+    template_id: int
+    compiled: CompiledTemplate
+    sender: Optional[str] = None
 
 
 class EmailService:
     """Service for managing email sending operations."""
     
-    def __init__(self, provider: IMailProvider = None):
+    def __init__(self, provider: IMailProvider = None, config: Dict[str, Any] = None):
         self.provider = provider or OutlookCOMProvider()
         self.audit_service = AuditService()
         
-        # Email queue and processing
+        # The "email" section of config.yaml
+        self.config = config or {}
+        
+        # Emails claimed from the outbox, waiting for a worker
         self.email_queue = Queue()
         self.is_processing = False
-        self.processing_thread = None
+        
+        # Durable outbox: workers claim small leased batches of it
+        self.outbox_batch_size = 20
+        self.outbox_lease_seconds = 600
+        self.outbox_poll_interval = 1.0
+        self._outbox_owner = uuid.uuid4().hex
+        self._work_available = threading.Event()
+        
+        # Recipients are copied into the outbox a page at a time, pausing
+        # while a wave already has outbox_backlog_limit emails waiting
+        self.recipient_page_size = 500
+        self.outbox_backlog_limit = 5000
+        self._filling_waves: Set[int] = set()
+        self._stop_feeding = threading.Event()
+        self.processing_threads: List[threading.Thread] = []
+        
+        # Send workers, capped by what the provider supports
+        self.max_workers = self.config.get('workers', 4)
+        self._dispatch_lock = threading.Lock()
         
         # Rate limiting (30 emails per minute by default)
-        self.rate_limiter = RateLimiter(rate=30, per_seconds=60)
+        self.rate_limiter = RateLimiter.from_config(self.config.get('throttle', {}))
         
         # Retry settings
         self.max_retries = 3
         self.retry_delays = [30, 120, 300]  # 30s, 2min, 5min
+        self.retry_jitter = 0.2  # Up to 20% added, so failed batches do not retry in lockstep
+        self.retry_scheduler = RetryScheduler()
+        
+        # Compiled templates keyed by template ID, invalidated by updated_at, so
+        # undeclared placeholders are reported once per version of a template
+        self._compiled_templates: Dict[int, CompiledTemplate] = {}
+        
+        # Per-wave send context, so the send loop does not re-read wave and template rows
+        self._wave_contexts: Dict[int, WaveContext] = {}
+        self._context_lock = threading.Lock()
+        
+        # Send results are written behind the send loop in batches
+        self.result_buffer = SendResultBuffer(
+            writer=self._write_send_records,
+            max_items=50,
+            max_delay=0.5,
+            journal_path=f"{get_database().database_path}-sendlog"
+        )
+        try:
+            self.result_buffer.recover()
+        except Exception as e:
+            logger.error(f"Failed to recover buffered send results: {e}")
+        atexit.register(self.result_buffer.flush)
         
     def create_template(self, name: str, subject: str, body: str, 
                        language: str = "en", created_by: int = None,
                        variables: Dict[str, str] = None) -> EmailTemplate:
         """Create a new email template."""
-        with Session(get_session()) as session:
+        with write_scope() as session:
             template = EmailTemplate(
                 name=name,
                 subject=subject,
@@ -106,12 +581,12 @@ class EmailService:
             
     def get_template(self, template_id: int) -> Optional[EmailTemplate]:
         """Get email template by ID."""
-        with Session(get_session()) as session:
+        with session_scope() as session:
             return session.get(EmailTemplate, template_id)
             
     def list_templates(self, language: str = None) -> List[EmailTemplate]:
         """List available email templates."""
-        with Session(get_session()) as session:
+        with session_scope() as session:
             query = select(EmailTemplate)
             
             if language:
@@ -120,34 +595,59 @@ class EmailService:
             query = query.order_by(EmailTemplate.name)
             return session.exec(query).all()
             
+    def update_template(self, template_id: int, **updates) -> Optional[EmailTemplate]:
+        """Update an email template and drop any cached compiled form of it."""
+        with write_scope() as session:
+            template = session.get(EmailTemplate, template_id)
+            
+            if not template:
+                return None
+                
+            # Update fields
+            for name, value in updates.items():
+                if hasattr(template, name):
+                    setattr(template, name, value)
+                    
+            template.updated_at = datetime.utcnow()
+            
+            session.add(template)
+            session.commit()
+            session.refresh(template)
+            
+        self.invalidate_template(template_id)
+        
+        logger.info(f"Email template updated: {template.name}")
+        return template
+        
+    def invalidate_template(self, template_id: int):
+        """Forget the compiled template and the wave contexts that use it."""
+        with self._context_lock:
+            self._compiled_templates.pop(template_id, None)
+            for wave_id in [wave_id for wave_id, context in self._wave_contexts.items()
+                            if context.template_id == template_id]:
+                del self._wave_contexts[wave_id]
+                
     def substitute_variables(self, template: str, contact_data: Dict[str, Any]) -> str:
         """Substitute variables in template with contact data."""
-        result = template
-        
-        # Standard variables
-        standard_vars = {
-            'first_name': contact_data.get('first_name', ''),
-            'last_name': contact_data.get('last_name', ''),
-            'email': contact_data.get('email', ''),
-            'full_name': f"{contact_data.get('first_name', '')} {contact_data.get('last_name', '')}".strip()
-        }
-        
-        # Add extra data variables
-        extra_data = contact_data.get('extra_data', {}) or {}
-        custom_data = contact_data.get('custom_data', {}) or {}
+        return _compile_text(template).render(build_template_variables(contact_data))
         
-        all_vars = {**standard_vars, **extra_data, **custom_data}
+    def get_compiled_template(self, template: EmailTemplate) -> CompiledTemplate:
+        """Get the compiled form of a template, compiling it on first use or after an update."""
+        compiled = self._compiled_templates.get(template.id)
+        if compiled is None or compiled.updated_at != template.updated_at:
+            compiled = CompiledTemplate.compile(template, self._contact_field_names())
+            if template.id is not None:
+                self._compiled_templates[template.id] = compiled
+        return compiled
         
-        # Perform substitution
-        for var_name, var_value in all_vars.items():
-            placeholder = f"{{{var_name}}}"
-            result = result.replace(placeholder, str(var_value) if var_value is not None else '')
+    def _contact_field_names(self) -> List[str]:
+        """Names of the declared contact attributes, which templates may use as placeholders."""
+        with session_scope() as session:
+            return list(session.exec(select(IndexedAttribute.name)).all())
             
-        return result
-        
     def preview_email(self, template_id: int, contact_id: int) -> Dict[str, str]:
         """Preview an email with variable substitution."""
-        with Session(get_session()) as session:
+        with session_scope() as session:
             template = session.get(EmailTemplate, template_id)
             contact = session.get(Contact, contact_id)
             
@@ -161,31 +661,25 @@ class EmailService:
                 'extra_data': contact.extra_data
             }
             
+            subject, body = self.get_compiled_template(template).render(contact_data)
+            
             return {
-                'subject': self.substitute_variables(template.subject, contact_data),
-                'body': self.substitute_variables(template.body, contact_data)
+                'subject': subject,
+                'body': body
             }
             
     def create_send_wave(self, campaign_id: int, wave_type: WaveType, 
                         template_id: int, initiated_by: int,
                         filter_criteria: Dict[str, Any] = None) -> SendWave:
         """Create a new send wave."""
-        with Session(get_session()) as session:
+        with write_scope() as session:
             # Count contacts that match the filter
-            contact_query = select(CampaignContact).where(
+            contact_query = select(func.count()).select_from(CampaignContact).where(
                 CampaignContact.campaign_id == campaign_id
             )
-            
-            # Apply filters
-            if filter_criteria:
-                status_filter = filter_criteria.get('status')
-                if status_filter:
-                    contact_query = contact_query.where(
-                        CampaignContact.status == ContactStatus(status_filter)
-                    )
-                    
-            contacts = session.exec(contact_query).all()
-            contact_count = len(contacts)
+            contact_count = session.exec(
+                self._filter_recipients(session, contact_query, filter_criteria)
+            ).one()
             
             # Create send wave
             wave = SendWave(
@@ -218,7 +712,7 @@ class EmailService:
             
     def start_send_wave(self, wave_id: int, progress_callback: Callable = None) -> bool:
         """Start sending emails for a wave."""
-        with Session(get_session()) as session:
+        with write_scope() as session:
             wave = session.get(SendWave, wave_id)
             
             if not wave:
@@ -232,96 +726,242 @@ class EmailService:
             # Update wave status
             wave.status = WaveStatus.RUNNING
             session.add(wave)
-            session.commit()
             
-            try:
-                # Get contacts for this wave
-                contacts_query = select(
-                    Contact, CampaignContact
-                ).join(
-                    CampaignContact, Contact.id == CampaignContact.contact_id
-                ).where(
-                    CampaignContact.campaign_id == wave.campaign_id
+        try:
+            # Load template and sender once for the whole wave
+            with session_scope() as session:
+                context = self._load_wave_context(session, wave)
+            if not context:
+                raise ValueError(f"Template not found: {wave.template_id}")
+                
+            with self._context_lock:
+                self._wave_contexts[wave_id] = context
+                
+            # Start processing if not already running
+            if not self.is_processing:
+                self._start_email_processing(progress_callback)
+                
+            # Workers send the first page while the rest is still being queued
+            self._start_wave_feeder(wave_id)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to start send wave {wave_id}: {e}")
+            
+            # Update wave status to failed
+            with write_scope() as session:
+                wave = session.get(SendWave, wave_id)
+                wave.status = WaveStatus.FAILED
+                session.add(wave)
+                
+            return False
+                
+    def _filter_recipients(self, session: Session, query, filter_criteria: Optional[Dict[str, Any]]):
+        """Apply a wave's filter criteria to a query over CampaignContact.
+        
+        Besides 'status', criteria may hold extra_data and custom_data
+        attribute predicates (see contact_service.attribute_conditions).
+        """
+        if filter_criteria:
+            status_filter = filter_criteria.get('status')
+            if status_filter:
+                query = query.where(
+                    CampaignContact.status == ContactStatus(status_filter)
                 )
                 
-                # Apply filters
-                if wave.filter_criteria:
-                    status_filter = wave.filter_criteria.get('status')
-                    if status_filter:
-                        contacts_query = contacts_query.where(
-                            CampaignContact.status == ContactStatus(status_filter)
-                        )
+            conditions = attribute_conditions(session, filter_criteria)
+            if AttributeSource.EXTRA_DATA in conditions:
+                query = query.join(Contact, Contact.id == CampaignContact.contact_id).where(
+                    *conditions[AttributeSource.EXTRA_DATA]
+                )
+            if AttributeSource.CUSTOM_DATA in conditions:
+                query = query.where(*conditions[AttributeSource.CUSTOM_DATA])
+        return query
+        
+    def _start_wave_feeder(self, wave_id: int):
+        """Start copying a wave's recipients into the outbox in the background."""
+        with self._context_lock:
+            if wave_id in self._filling_waves:
+                return
+            self._filling_waves.add(wave_id)
+            
+        threading.Thread(
+            target=self._feed_wave,
+            args=(wave_id,),
+            name=f"wave-feeder-{wave_id}",
+            daemon=True
+        ).start()
+        
+    def _feed_wave(self, wave_id: int):
+        """Copy a wave's recipients into the outbox one keyset page at a time.
+        
+        Pages follow the (campaign_id, contact_id) primary key of
+        campaign_contacts. They start after the last contact already queued
+        or logged for the wave, so a resumed wave picks up where the previous
+        run stopped.
+        """
+        queued = 0
+        finished = False
+        try:
+            with session_scope() as session:
+                wave = session.get(SendWave, wave_id)
+                campaign_id, filter_criteria = wave.campaign_id, wave.filter_criteria
+                last_contact_id = max(
+                    session.exec(
+                        select(func.max(SendOutbox.contact_id)).where(SendOutbox.wave_id == wave_id)
+                    ).one() or 0,
+                    session.exec(
+                        select(func.max(MailLog.contact_id)).where(MailLog.wave_id == wave_id)
+                    ).one() or 0
+                )
+                
+            while not self._stop_feeding.is_set():
+                with session_scope() as session:
+                    backlog = session.exec(
+                        select(func.count()).select_from(SendOutbox).where(SendOutbox.wave_id == wave_id)
+                    ).one()
+                    if backlog >= self.outbox_backlog_limit:
+                        # Back-pressure: let the workers catch up
+                        self._stop_feeding.wait(self.outbox_poll_interval)
+                        continue
                         
-                contacts = session.exec(contacts_query).all()
-                
-                # Queue emails for sending
-                total_queued = 0
-                for contact, campaign_contact in contacts:
-                    contact_data = {
-                        'first_name': contact.first_name,
-                        'last_name': contact.last_name,
-                        'email': contact.email,
-                        'extra_data': contact.extra_data,
-                        'custom_data': campaign_contact.custom_data
-                    }
-                    
-                    queue_item = EmailQueueItem(
-                        wave_id=wave_id,
-                        contact_id=contact.id,
-                        template_id=wave.template_id,
-                        email_data=contact_data
-                    )
+                    page = session.exec(
+                        self._filter_recipients(
+                            session,
+                            select(CampaignContact.contact_id).where(
+                                CampaignContact.campaign_id == campaign_id,
+                                CampaignContact.contact_id > last_contact_id
+                            ),
+                            filter_criteria
+                        ).order_by(CampaignContact.contact_id).limit(self.recipient_page_size)
+                    ).all()
                     
-                    self.email_queue.put(queue_item)
-                    total_queued += 1
+                if page:
+                    now = datetime.utcnow()
+                    with write_scope() as session:
+                        session.exec(
+                            sqlite_insert(SendOutbox).on_conflict_do_nothing(
+                                index_elements=["wave_id", "contact_id"]
+                            ),
+                            params=[
+                                {"wave_id": wave_id, "contact_id": contact_id, "attempt": 0, "not_before": now}
+                                for contact_id in page
+                            ]
+                        )
+                        
+                    last_contact_id = page[-1]
+                    queued += len(page)
+                    self._work_available.set()
                     
-                logger.info(f"Queued {total_queued} emails for wave {wave_id}")
-                
-                # Start processing if not already running
-                if not self.is_processing:
-                    self._start_email_processing(progress_callback)
+                if len(page) < self.recipient_page_size:
+                    finished = True
+                    break
                     
-                return True
-                
-            except Exception as e:
-                logger.error(f"Failed to start send wave {wave_id}: {e}")
-                
-                # Update wave status to failed
-                wave.status = WaveStatus.FAILED
-                session.add(wave)
-                session.commit()
+        except Exception as e:
+            logger.error(f"Failed to queue recipients for wave {wave_id}, will resume on restart: {e}")
+        finally:
+            with self._context_lock:
+                self._filling_waves.discard(wave_id)
                 
-                return False
+        logger.info(f"Queued {queued} emails for wave {wave_id}")
+        if not finished:
+            return
+            
+        # Every email may already have been sent while the last page was queued
+        try:
+            with write_scope() as session:
+                pending = session.exec(
+                    select(SendOutbox.id).where(SendOutbox.wave_id == wave_id).limit(1)
+                ).first()
+                if pending is None:
+                    self._complete_waves(session, [wave_id])
+        except Exception as e:
+            logger.error(f"Failed to complete wave {wave_id}: {e}")
+            
+    def resume_send_waves(self, progress_callback: Callable = None) -> int:
+        """Resume the waves a previous run left running.
+        
+        Leases held by the previous run are released and the recipients not
+        queued yet are fed into the outbox again. Waves with nothing left to
+        send are marked completed. Returns the number of waves resumed.
+        """
+        with write_scope() as session:
+            # IS NOT NULL lets the lease_owner index skip the unleased rows
+            session.exec(
+                update(SendOutbox).where(
+                    SendOutbox.lease_owner.isnot(None),
+                    SendOutbox.lease_owner != self._outbox_owner
+                ).values(lease_owner=None, lease_until=None)
+            )
+            
+        with session_scope() as session:
+            running = session.exec(
+                select(SendWave.id).where(SendWave.status == WaveStatus.RUNNING)
+            ).all()
+            
+        if running:
+            logger.info(f"Resuming send waves: {list(running)}")
+            if not self.is_processing:
+                self._start_email_processing(progress_callback)
+            for wave_id in running:
+                self._start_wave_feeder(wave_id)
                 
+        return len(running)
+        
     def _start_email_processing(self, progress_callback: Callable = None):
-        """Start email processing thread."""
+        """Start the email send workers."""
         if self.is_processing:
             return
             
         self.is_processing = True
-        self.processing_thread = threading.Thread(
-            target=self._process_email_queue,
-            args=(progress_callback,),
-            daemon=True
-        )
-        self.processing_thread.start()
+        self._stop_feeding.clear()
+        self.rate_limiter.reset()
+        self.result_buffer.start()
+        
+        worker_count = max(1, min(self.max_workers, self.provider.get_max_concurrency()))
+        self.processing_threads = [
+            threading.Thread(
+                target=self._process_email_queue,
+                args=(progress_callback,),
+                name=f"email-worker-{index + 1}",
+                daemon=True
+            )
+            for index in range(worker_count)
+        ]
+        for thread in self.processing_threads:
+            thread.start()
+            
+        logger.info(f"Started {worker_count} email worker(s) for {self.provider.get_provider_name()}")
         
     def _process_email_queue(self, progress_callback: Callable = None):
-        """Process emails from the queue."""
-        logger.info("Email processing thread started")
+        """Send emails claimed from the outbox until processing stops."""
+        logger.info(f"Email worker {threading.current_thread().name} started")
         
         try:
-            while self.is_processing or not self.email_queue.empty():
+            while self.is_processing:
                 try:
-                    # Get next email with timeout
-                    item = self.email_queue.get(timeout=5)
-                    
-                    # Wait for rate limit
-                    while not self.rate_limiter.acquire():
-                        wait_time = self.rate_limiter.time_until_next_slot()
-                        if wait_time > 0:
-                            time.sleep(min(wait_time, 1.0))
-                            
+                    # Take the next email and its rate limit slot together, so
+                    # sends start in queue order whatever the number of workers
+                    with self._dispatch_lock:
+                        item = self._next_queue_item()
+                        
+                        if item is not None:
+                            # Wait for rate limit, sleeping until the next token is due
+                            context = self._get_wave_context(item.wave_id)
+                            sender = context.sender if context else None
+                            if not self.rate_limiter.acquire(timeout=None, sender=sender):
+                                # Interrupted by stop_processing; the lease is released on stop
+                                break
+                                
+                    if item is None:
+                        # Nothing due: wait for a new wave, the next retry or the next poll
+                        wait = self.retry_scheduler.time_until_next()
+                        self._work_available.wait(
+                            self.outbox_poll_interval if wait is None else min(wait, self.outbox_poll_interval)
+                        )
+                        self._work_available.clear()
+                        continue
+                        
                     # Process the email
                     success = self._send_single_email(item)
                     
@@ -332,31 +972,152 @@ class EmailService:
                         except Exception as e:
                             logger.error(f"Progress callback error: {e}")
                             
-                    self.email_queue.task_done()
-                    
-                except Empty:
-                    # No items in queue, continue loop
-                    continue
                 except Exception as e:
                     logger.error(f"Error processing email queue: {e}")
                     
         finally:
             self.is_processing = False
-            logger.info("Email processing thread stopped")
+            logger.info(f"Email worker {threading.current_thread().name} stopped")
+            
+    def _next_queue_item(self) -> Optional[EmailQueueItem]:
+        """Next email to send: a due retry first, then claimed emails, claiming
+        a new batch from the outbox when none is left."""
+        item = self.retry_scheduler.pop_due()
+        if item is not None:
+            return item
             
-    def _send_single_email(self, item: EmailQueueItem) -> bool:
-        """Send a single email and log the result."""
         try:
-            with Session(get_session()) as session:
-                # Get template
-                template = session.get(EmailTemplate, item.template_id)
-                if not template:
-                    logger.error(f"Template not found: {item.template_id}")
-                    return False
+            return self.email_queue.get_nowait()
+        except Empty:
+            pass
+            
+        if not self._claim_outbox_batch():
+            return None
+            
+        try:
+            return self.email_queue.get_nowait()
+        except Empty:
+            return None
+            
+    def _claim_outbox_batch(self) -> int:
+        """Lease the next due outbox rows and queue them with their contact data.
+        
+        The lease is taken with a conditional UPDATE and the rows read back by
+        owner, so two processes never claim the same row. Due rows are looked
+        up on a reader, so polling an idle outbox never waits for the writer.
+        """
+        now = datetime.utcnow()
+        with session_scope() as session:
+            due_ids = session.exec(
+                select(SendOutbox.id).where(
+                    SendOutbox.not_before <= now,
+                    or_(SendOutbox.lease_until.is_(None), SendOutbox.lease_until < now)
+                ).order_by(SendOutbox.not_before, SendOutbox.id).limit(self.outbox_batch_size)
+            ).all()
+        if not due_ids:
+            return 0
+            
+        with write_scope() as session:
+            session.exec(
+                update(SendOutbox).where(
+                    SendOutbox.id.in_(due_ids),
+                    or_(SendOutbox.lease_until.is_(None), SendOutbox.lease_until < now)
+                ).values(
+                    lease_owner=self._outbox_owner,
+                    lease_until=now + timedelta(seconds=self.outbox_lease_seconds)
+                )
+            )
+            
+            rows = session.exec(
+                select(
+                    SendOutbox.id, SendOutbox.wave_id, SendOutbox.contact_id, SendOutbox.attempt,
+                    SendWave.template_id, Contact.first_name, Contact.last_name, Contact.email,
+                    Contact.extra_data, CampaignContact.custom_data
+                ).join(
+                    SendWave, SendWave.id == SendOutbox.wave_id
+                ).join(
+                    Contact, Contact.id == SendOutbox.contact_id
+                ).outerjoin(
+                    CampaignContact, and_(
+                        CampaignContact.campaign_id == SendWave.campaign_id,
+                        CampaignContact.contact_id == SendOutbox.contact_id
+                    )
+                ).where(
+                    SendOutbox.id.in_(due_ids),
+                    SendOutbox.lease_owner == self._outbox_owner
+                ).order_by(SendOutbox.id)
+            ).all()
+            
+        for row in rows:
+            self.email_queue.put(EmailQueueItem(
+                wave_id=row.wave_id,
+                contact_id=row.contact_id,
+                template_id=row.template_id,
+                email_data={
+                    'first_name': row.first_name,
+                    'last_name': row.last_name,
+                    'email': row.email,
+                    'extra_data': row.extra_data,
+                    'custom_data': row.custom_data
+                },
+                retry_count=row.attempt,
+                outbox_id=row.id
+            ))
+            
+        return len(rows)
+        
+    def _load_wave_context(self, session: Session, wave: SendWave) -> Optional[WaveContext]:
+        """Build the send context of a wave from its row and template."""
+        template = session.get(EmailTemplate, wave.template_id)
+        if not template:
+            logger.error(f"Template not found: {wave.template_id}")
+            return None
+            
+        return WaveContext(
+            wave_id=wave.id,
+            campaign_id=wave.campaign_id,
+            template_id=template.id,
+            compiled=self.get_compiled_template(template),
+            sender=getattr(self.provider, "sender_email", None)
+        )
+        
+    def _get_wave_context(self, wave_id: int) -> Optional[WaveContext]:
+        """Get the send context of a wave, reloading it only after an invalidation."""
+        with self._context_lock:
+            context = self._wave_contexts.get(wave_id)
+            
+        if context is None:
+            with session_scope() as session:
+                wave = session.get(SendWave, wave_id)
+                if not wave:
+                    logger.error(f"Send wave not found: {wave_id}")
+                    return None
+                    
+                context = self._load_wave_context(session, wave)
+                
+            if context:
+                with self._context_lock:
+                    self._wave_contexts[wave_id] = context
                     
+        return context
+        
+    def _send_single_email(self, item: EmailQueueItem) -> bool:
+        """Send a single email and log the result.
+        
+        A claimed email always ends with a recorded result, or with its outbox
+        row removed when its wave can no longer be sent, so it is never left
+        leased for another worker to retry without limit.
+        """
+        try:
+            context = self._get_wave_context(item.wave_id)
+            if not context:
+                self._drop_outbox_row(item)
+                return False
+                
+            subject = body = None
+            try:
                 # Create email message
-                subject = self.substitute_variables(template.subject, item.email_data)
-                body = self.substitute_variables(template.body, item.email_data)
+                subject, body = context.compiled.render(item.email_data)
                 
                 email_message = EmailMessage(
                     to=item.email_data['email'],
@@ -366,100 +1127,288 @@ class EmailService:
                 
                 # Send email
                 result = self.provider.send_email(email_message)
+            except Exception as e:
+                # Recorded as a failed attempt, so the retry limit and schedule apply
+                logger.error(f"Error sending email for contact {item.contact_id}: {e}")
+                result = SendResult(SendStatus.RETRY, error_message=str(e))
                 
-                # Log the attempt
-                mail_log = MailLog(
-                    wave_id=item.wave_id,
-                    contact_id=item.contact_id,
-                    template_id=item.template_id,
-                    status=MailStatus.SENT if result.success else MailStatus.FAILED,
-                    error_message=result.error_message,
-                    retry_count=item.retry_count,
-                    subject_sent=subject,
-                    body_sent=body,
-                    outlook_message_id=result.message_id
-                )
+            retry_at = None
+            if not result.success and result.should_retry and item.retry_count < self.max_retries:
+                delay = self._retry_delay(item.retry_count, result.retry_after)
+                retry_at = datetime.utcnow() + timedelta(seconds=delay)
                 
-                session.add(mail_log)
-                
-                # Update contact status
-                if result.success:
-                    # Update campaign contact status
-                    campaign_contact = session.exec(
-                        select(CampaignContact).where(
-                            and_(
-                                CampaignContact.campaign_id == session.get(SendWave, item.wave_id).campaign_id,
-                                CampaignContact.contact_id == item.contact_id
-                            )
-                        )
-                    ).first()
-                    
-                    if campaign_contact:
-                        campaign_contact.status = ContactStatus.SENT
-                        campaign_contact.sent_at = datetime.utcnow()
-                        session.add(campaign_contact)
-                        
-                elif result.should_retry and item.retry_count < self.max_retries:
-                    # Queue for retry
-                    item.retry_count += 1
-                    delay = self.retry_delays[min(item.retry_count - 1, len(self.retry_delays) - 1)]
-                    
-                    # Schedule retry (simplified - in production, use a proper scheduler)
-                    threading.Timer(delay, lambda: self.email_queue.put(item)).start()
-                    logger.info(f"Email queued for retry {item.retry_count} in {delay}s")
-                    
-                session.commit()
+            # Recorded by the write-behind buffer, which also updates the outbox
+            self.result_buffer.add(SendRecord(
+                wave_id=item.wave_id,
+                campaign_id=context.campaign_id,
+                contact_id=item.contact_id,
+                template_id=context.template_id,
+                status=MailStatus.SENT if result.success else MailStatus.FAILED,
+                retry_count=item.retry_count,
+                error_message=result.error_message,
+                subject_sent=subject,
+                body_sent=body,
+                outlook_message_id=result.message_id,
+                outbox_id=item.outbox_id,
+                retry_at=retry_at
+            ))
+            
+            if retry_at:
+                # Queue for retry
+                item.retry_count += 1
+                self.retry_scheduler.schedule(item, delay)
+                logger.info(f"Email queued for retry {item.retry_count} in {delay:.0f}s")
+                
+            if result.success:
+                logger.info(f"Email sent successfully to {item.email_data['email']}")
+                return True
+            else:
+                logger.error(f"Failed to send email to {item.email_data['email']}: {result.error_message}")
+                return False
                 
-                if result.success:
-                    logger.info(f"Email sent successfully to {item.email_data['email']}")
-                    return True
-                else:
-                    logger.error(f"Failed to send email to {item.email_data['email']}: {result.error_message}")
-                    return False
-                    
         except Exception as e:
             logger.error(f"Error sending email: {e}")
             return False
             
+    def _drop_outbox_row(self, item: EmailQueueItem):
+        """Remove the outbox row of an email whose wave or template is gone."""
+        if item.outbox_id is None:
+            return
+            
+        try:
+            with write_scope() as session:
+                session.exec(delete(SendOutbox).where(SendOutbox.id == item.outbox_id))
+                pending = session.exec(
+                    select(SendOutbox.id).where(SendOutbox.wave_id == item.wave_id).limit(1)
+                ).first()
+                if pending is None and session.get(SendWave, item.wave_id):
+                    self._complete_waves(session, [item.wave_id])
+        except Exception as e:
+            logger.error(f"Failed to remove outbox row {item.outbox_id}: {e}")
+            
+    def _retry_delay(self, retry_count: int, retry_after: Optional[int] = None) -> float:
+        """Delay before the next attempt, never shorter than the provider's retry_after."""
+        delay = self.retry_delays[min(retry_count, len(self.retry_delays) - 1)]
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay * random.uniform(1, 1 + self.retry_jitter)
+        
+    def get_retry_status(self) -> Dict[str, Any]:
+        """Number of emails waiting for a retry and when the next one is due."""
+        next_due = self.retry_scheduler.next_due_at()
+        return {
+            "pending": len(self.retry_scheduler),
+            "next_due_at": next_due.isoformat() if next_due else None
+        }
+        
+    def _write_send_records(self, records: List[SendRecord], skip_existing: bool = False):
+        """Write a batch of send results in one transaction.
+        
+        Mail logs go in with one executemany insert and sent contacts are
+        updated with one bulk UPDATE. The sent and failed counters of each
+        wave move by the same amounts. Outbox rows of finished emails are
+        deleted in the same transaction, and those due for a retry are
+        rescheduled, so a resumed wave never sends a recorded email again.
+        ``skip_existing`` drops records whose attempt is already logged, for
+        journal replay after a crash.
+        """
+        with write_scope() as session:
+            if skip_existing:
+                logged = set(
+                    session.exec(
+                        select(MailLog.wave_id, MailLog.contact_id, MailLog.retry_count).where(
+                            MailLog.wave_id.in_({record.wave_id for record in records})
+                        )
+                    ).all()
+                )
+                records = [
+                    record for record in records
+                    if (record.wave_id, record.contact_id, record.retry_count) not in logged
+                ]
+                if not records:
+                    return
+                    
+            session.exec(
+                insert(MailLog),
+                params=[
+                    {
+                        "wave_id": record.wave_id,
+                        "contact_id": record.contact_id,
+                        "template_id": record.template_id,
+                        "status": record.status,
+                        "error_message": record.error_message,
+                        "sent_at": record.sent_at,
+                        "retry_count": record.retry_count,
+                        "subject_sent": record.subject_sent,
+                        "body_sent": record.body_sent,
+                        "outlook_message_id": record.outlook_message_id
+                    }
+                    for record in records
+                ]
+            )
+            
+            # Where-based updates: a row removed meanwhile is skipped, not an error
+            sent_contacts = [
+                {
+                    "campaign": record.campaign_id,
+                    "contact": record.contact_id,
+                    "sent": record.sent_at
+                }
+                for record in records if record.status == MailStatus.SENT
+            ]
+            if sent_contacts:
+                campaign_contacts = CampaignContact.__table__
+                session.exec(
+                    update(campaign_contacts).where(
+                        campaign_contacts.c.campaign_id == bindparam("campaign"),
+                        campaign_contacts.c.contact_id == bindparam("contact")
+                    ).values(
+                        status=ContactStatus.SENT,
+                        sent_at=bindparam("sent"),
+                        updated_at=bindparam("sent")
+                    ),
+                    params=sent_contacts
+                )
+                
+            progress: Dict[int, Dict[str, int]] = {}
+            for record in records:
+                counts = progress.setdefault(record.wave_id, {"sent": 0, "failed": 0})
+                counts["sent" if record.status == MailStatus.SENT else "failed"] += 1
+            waves = SendWave.__table__
+            session.exec(
+                update(waves).where(waves.c.id == bindparam("wave")).values(
+                    sent_count=waves.c.sent_count + bindparam("sent"),
+                    failed_count=waves.c.failed_count + bindparam("failed")
+                ),
+                params=[{"wave": wave_id, **counts} for wave_id, counts in progress.items()]
+            )
+            
+            finished = {
+                record.outbox_id for record in records
+                if record.outbox_id is not None and record.retry_at is None
+            }
+            if finished:
+                session.exec(delete(SendOutbox).where(SendOutbox.id.in_(finished)))
+                
+            # A batch can hold an attempt scheduled for retry and the final
+            # result of the same email; the final result wins
+            retries = [
+                {
+                    "outbox": record.outbox_id,
+                    "next_attempt": record.retry_count + 1,
+                    "due": record.retry_at,
+                    # Held until the in-memory retry has run
+                    "lease": record.retry_at + timedelta(seconds=self.outbox_lease_seconds)
+                }
+                for record in records
+                if record.outbox_id is not None and record.retry_at is not None
+                and record.outbox_id not in finished
+            ]
+            if retries:
+                outbox = SendOutbox.__table__
+                session.exec(
+                    update(outbox).where(outbox.c.id == bindparam("outbox")).values(
+                        attempt=bindparam("next_attempt"),
+                        not_before=bindparam("due"),
+                        lease_until=bindparam("lease")
+                    ),
+                    params=retries
+                )
+                
+            wave_ids = {record.wave_id for record in records if record.retry_at is None}
+            if wave_ids:
+                queued = set(
+                    session.exec(
+                        select(SendOutbox.wave_id).where(SendOutbox.wave_id.in_(wave_ids)).distinct()
+                    ).all()
+                )
+                self._complete_waves(session, wave_ids - queued)
+                
+    def _complete_waves(self, session: Session, wave_ids: Iterable[int]):
+        """Mark running waves with nothing left in the outbox as completed.
+        
+        Their progress counters are reconciled with the mail logs at the same
+        time, with one grouped count.
+        """
+        with self._context_lock:
+            # A wave still being fed only looks empty
+            wave_ids = [wave_id for wave_id in wave_ids if wave_id not in self._filling_waves]
+        if not wave_ids:
+            return
+            
+        session.exec(
+            update(SendWave).where(
+                SendWave.id.in_(wave_ids),
+                SendWave.status == WaveStatus.RUNNING
+            ).values(status=WaveStatus.COMPLETED, completed_at=datetime.utcnow())
+        )
+        
+        counts = {wave_id: {"id": wave_id, "sent_count": 0, "failed_count": 0} for wave_id in wave_ids}
+        for wave_id, status, count in session.exec(
+            select(MailLog.wave_id, MailLog.status, func.count()).where(
+                MailLog.wave_id.in_(wave_ids)
+            ).group_by(MailLog.wave_id, MailLog.status)
+        ).all():
+            if status == MailStatus.SENT:
+                counts[wave_id]["sent_count"] += count
+            elif status == MailStatus.FAILED:
+                counts[wave_id]["failed_count"] += count
+        session.exec(update(SendWave), params=list(counts.values()))
+        with self._context_lock:
+            for wave_id in wave_ids:
+                self._wave_contexts.pop(wave_id, None)
+            
     def stop_processing(self):
-        """Stop email processing."""
+        """Stop email processing and write any buffered send results."""
         self.is_processing = False
-        if self.processing_thread:
-            self.processing_thread.join(timeout=10)
+        self._stop_feeding.set()
+        self.rate_limiter.interrupt()
+        self._work_available.set()
+        for thread in self.processing_threads:
+            thread.join(timeout=10)
+        self.processing_threads = []
+        self.result_buffer.stop()
+        
+        # Claimed emails and pending retries go back to the outbox for the next run
+        with self._dispatch_lock:
+            self.email_queue = Queue()
+            self.retry_scheduler.clear()
+        try:
+            with write_scope() as session:
+                session.exec(
+                    update(SendOutbox).where(
+                        SendOutbox.lease_owner == self._outbox_owner
+                    ).values(lease_owner=None, lease_until=None)
+                )
+        except Exception as e:
+            logger.error(f"Failed to release outbox leases: {e}")
             
     def get_wave_status(self, wave_id: int) -> Dict[str, Any]:
-        """Get status of a send wave."""
-        with Session(get_session()) as session:
+        """Get status of a send wave.
+        
+        Counts come from the wave's counters plus the results still waiting
+        in the write-behind buffer, so no mail logs are read.
+        """
+        with session_scope() as session:
             wave = session.get(SendWave, wave_id)
             
             if not wave:
                 return {}
                 
-            # Count sent emails
-            sent_count = session.exec(
-                select(MailLog).where(
-                    and_(
-                        MailLog.wave_id == wave_id,
-                        MailLog.status == MailStatus.SENT
-                    )
-                )
-            ).all()
-            
-            failed_count = session.exec(
-                select(MailLog).where(
-                    and_(
-                        MailLog.wave_id == wave_id,
-                        MailLog.status == MailStatus.FAILED
-                    )
-                )
-            ).all()
+            pending = self.result_buffer.pending_counts(wave_id)
             
             return {
                 "wave_id": wave_id,
                 "status": wave.status.value,
                 "contact_count": wave.contact_count,
-                "sent_count": len(sent_count),
-                "failed_count": len(failed_count),
+                "sent_count": wave.sent_count + pending.get(MailStatus.SENT, 0),
+                "failed_count": wave.failed_count + pending.get(MailStatus.FAILED, 0),
                 "created_at": wave.created_at.isoformat(),
                 "completed_at": wave.completed_at.isoformat() if wave.completed_at else None
-            }
\ No newline at end of file
+            }
+
+
+@lru_cache(maxsize=128)
+def _compile_text(text: str) -> CompiledText:
+    """Compile ad-hoc template text, reusing the result for repeated strings."""
+    return CompiledText(text)
@@ -119,6 +119,14 @@ class API {
         return this.call('search_contacts', campaignId, query, filters);
     }
     
+    async getIndexedAttributes() {
+        return this.call('get_indexed_attributes');
+    }
+    
+    async indexContactAttribute(name, source = 'EXTRA_DATA') {
+        return this.call('index_contact_attribute', name, source);
+    }
+    
     // Email Templates
     async getTemplates(language = null) {
         return this.call('get_templates', language);
@@ -21,6 +21,7 @@ import webview
 import yaml
 from backend.database import database
 from backend.services import AuthService, CampaignService, EmailService, ContactService, AuditService
+from backend.models.contact import AttributeSource
 from backend.providers import OutlookCOMProvider
 
 
@@ -65,7 +66,7 @@ class SurveyToolAPI:
         outlook_provider = OutlookCOMProvider(
             sender_email=email_config.get('default_sender')
         )
-        self.email_service = EmailService(provider=outlook_provider)
+        self.email_service = EmailService(provider=outlook_provider, config=email_config)
         
         self.contact_service = ContactService()
         self.audit_service = AuditService()
@@ -157,6 +158,8 @@ class SurveyToolAPI:
                     "status": campaign.status.value,
                     "owner_id": campaign.owner_id,
                     "contact_count": campaign.contact_count,
+                    "sent_count": campaign.sent_count,
+                    "contact_stats": self.campaign_service.get_contact_stats(campaign),
                     "created_at": campaign.created_at.isoformat(),
                     "launch_date": campaign.launch_date.isoformat() if campaign.launch_date else None
                 })
@@ -167,6 +170,81 @@ class SurveyToolAPI:
             self.logger.error(f"Error getting campaigns: {e}")
             return {"success": False, "error": str(e)}
             
+    def get_campaign_contacts(self, campaign_id: int, params: dict = None) -> dict:
+        """Get one page of a campaign's contacts."""
+        try:
+            if not self.current_user:
+                return {"success": False, "error": "Authentication required"}
+                
+            params = params or {}
+            page = self.contact_service.list_campaign_contacts(
+                campaign_id,
+                after_contact_id=params.get('cursor'),
+                limit=params.get('limit') or self.config.get('ui', {}).get('items_per_page', 25),
+                status=params.get('status'),
+                include_data=params.get('include_data', True),
+                with_total=params.get('with_total', False)
+            )
+            
+            return {"success": True, "data": page}
+            
+        except Exception as e:
+            self.logger.error(f"Error getting campaign contacts: {e}")
+            return {"success": False, "error": str(e)}
+            
+    def search_contacts(self, campaign_id: int, query: str, filters: dict = None) -> dict:
+        """Search a campaign's contacts by email or name."""
+        try:
+            if not self.current_user:
+                return {"success": False, "error": "Authentication required"}
+                
+            filters = filters or {}
+            contacts = self.contact_service.search_contacts(
+                campaign_id,
+                query=query,
+                status=filters.get('status'),
+                limit=filters.get('limit') or self.config.get('ui', {}).get('items_per_page', 25),
+                attributes=filters.get('attributes'),
+                custom_attributes=filters.get('custom_attributes')
+            )
+            
+            return {"success": True, "data": contacts}
+            
+        except Exception as e:
+            self.logger.error(f"Error searching contacts: {e}")
+            return {"success": False, "error": str(e)}
+            
+    def get_indexed_attributes(self) -> dict:
+        """Get the contact attributes declared as indexed."""
+        try:
+            if not self.current_user:
+                return {"success": False, "error": "Authentication required"}
+                
+            attributes = self.contact_service.get_indexed_attributes()
+            
+            return {"success": True, "data": [
+                {"name": attribute.name, "source": attribute.source.value}
+                for attribute in attributes
+            ]}
+            
+        except Exception as e:
+            self.logger.error(f"Error getting indexed attributes: {e}")
+            return {"success": False, "error": str(e)}
+            
+    def index_contact_attribute(self, name: str, source: str = 'EXTRA_DATA') -> dict:
+        """Declare a contact JSON attribute as indexed for filtering."""
+        try:
+            if not self.current_user:
+                return {"success": False, "error": "Authentication required"}
+                
+            attribute = self.contact_service.index_attribute(name, AttributeSource(source))
+            
+            return {"success": True, "data": {"name": attribute.name, "source": attribute.source.value}}
+            
+        except Exception as e:
+            self.logger.error(f"Error indexing contact attribute: {e}")
+            return {"success": False, "error": str(e)}
+            
     def create_campaign(self, data: dict) -> dict:
         """Create a new campaign."""
         try:
@@ -287,14 +365,7 @@ class SurveyToolAPI:
     def get_dashboard_stats(self) -> dict:
         """Get dashboard statistics."""
         try:
-            # This would be implemented to gather stats from all services
-            stats = {
-                "total_campaigns": 0,
-                "total_contacts": 0,
-                "emails_sent": 0,
-                "response_rate": 0.0
-            }
-            
+            stats = self.campaign_service.get_dashboard_stats()
             return {"success": True, "data": stats}
             
         except Exception as e:
@@ -318,6 +389,7 @@ class SurveyToolAPI:
                 "app_name": self.config.get('application', {}).get('name', 'Survey Tool'),
                 "version": self.config.get('application', {}).get('version', '1.0.0'),
                 "database_size": database.get_database_size(),
+                "database_storage": database.maintenance.metrics(),
                 "python_version": sys.version,
                 "platform": sys.platform
             }
@@ -327,6 +399,37 @@ class SurveyToolAPI:
         except Exception as e:
             self.logger.error(f"Error getting system info: {e}")
             return {"success": False, "error": str(e)}
+            
+    def backup_database(self) -> dict:
+        """Back up the database while the application keeps running."""
+        try:
+            if not self.current_user:
+                return {"success": False, "error": "Authentication required"}
+                
+            # Progress callback for frontend updates
+            def progress_callback(current, total):
+                try:
+                    webview.windows[0].evaluate_js(
+                        f'window.progressCallback && window.progressCallback({current}, {total})'
+                    )
+                except Exception:
+                    pass
+                    
+            backup_path = database.backup_database(progress_callback=progress_callback)
+            if not backup_path:
+                return {"success": False, "error": "Backup failed or backups are disabled"}
+                
+            self.audit_service.log_action(
+                action="DATABASE_BACKUP",
+                user_id=self.current_user['id'],
+                details={"path": backup_path}
+            )
+            
+            return {"success": True, "data": {"path": backup_path}}
+            
+        except Exception as e:
+            self.logger.error(f"Error backing up database: {e}")
+            return {"success": False, "error": str(e)}
 
 
 def load_config():
@@ -432,7 +535,9 @@ def main():
     
     try:
         # Initialize database
+        database.configure(config.get('database', {}))
         database.create_tables()
+        database.maintenance.start()
         logger.info("Database initialized")
         
         # Create default user if needed
@@ -442,6 +547,9 @@ def main():
         api = SurveyToolAPI(config)
         logger.info("Survey Tool API initialized")
         
+        # Resume send waves interrupted by the previous run
+        api.email_service.resume_send_waves()
+        
         # Check if web server mode is requested
         if args.port > 0:
             logger.info(f"Starting web server mode on port {args.port}")
@@ -488,6 +596,7 @@ def main():
         sys.exit(1)
     finally:
         logger.info("Application shutting down")
+        database.maintenance.stop()
 
 
 if __name__ == '__main__':
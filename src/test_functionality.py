@@ -227,7 +227,7 @@ class FunctionalityTester:
                 
                 # Test de recherche de contact
                 logger.info("  - Test de recherche de contact...")
-                found_contacts = self.contact_service.search_contacts(unique_email)
+                found_contacts = self.contact_service.search_all_contacts(unique_email)
                 if found_contacts and len(found_contacts) > 0:
                     logger.info("  ✅ Recherche de contact réussie")
                 else:
@@ -315,6 +315,245 @@ class FunctionalityTester:
             self.results['audit_logging'] = {'status': 'error', 'details': str(e)}
             return False
     
+    def test_query_plans(self):
+        """Vérifier que les requêtes des services utilisent les index"""
+        logger.info("🔎 Test des plans de requêtes...")
+        
+        try:
+            if not self.test_user:
+                logger.error("❌ Utilisateur de test non disponible")
+                return False
+                
+            # Campagne de test avec quelques contacts
+            import time
+            from backend.models.contact import ContactStatus
+            from backend.models.email import WaveType, WaveStatus
+            from backend.providers.base import IMailProvider, SendResult, SendStatus
+            from backend.services.email_service import RateLimiter
+            
+            class LocalProvider(IMailProvider):
+                """Fournisseur sans envoi réel, pour exécuter une vague"""
+                sender_email = "plans@example.com"
+                
+                def send_email(self, message):
+                    return SendResult(SendStatus.SUCCESS, message_id=message.to)
+                    
+                def validate_connection(self):
+                    return True
+                    
+                def get_provider_name(self):
+                    return "local"
+                    
+            campaign = self.campaign_service.create_campaign(
+                title="Campagne plans de requêtes",
+                owner_id=self.test_user.id
+            )
+            self.contact_service.bulk_add_contacts_to_campaign(
+                campaign.id,
+                [
+                    {'email': f"plan.{campaign.id}.{i}@example.com", 'first_name': 'Jean', 'last_name': f"Test{i}"}
+                    for i in range(50)
+                ]
+            )
+            
+            logger.info("  - Exécution des requêtes des services...")
+            with database.record_queries() as queries:
+                self.campaign_service.list_campaigns(owner_id=self.test_user.id)
+                self.campaign_service.get_campaign_statistics(campaign.id)
+                self.campaign_service.get_dashboard_stats()
+                self.contact_service.get_campaigns_contact_stats([campaign.id])
+                page = self.contact_service.list_campaign_contacts(campaign.id, limit=10, with_total=True)
+                self.contact_service.list_campaign_contacts(
+                    campaign.id, after_contact_id=page['next_cursor'],
+                    status=ContactStatus.PENDING, with_total=True
+                )
+                self.contact_service.search_contacts(campaign.id, "plan.", status=ContactStatus.PENDING)
+                self.contact_service.search_all_contacts(f"plan.{campaign.id}.1")
+                self.contact_service.update_contact_status(
+                    campaign.id, page['contacts'][0]['id'], ContactStatus.SENT, user_id=self.test_user.id
+                )
+                template = self.email_service.create_template(
+                    name="Template plans de requêtes",
+                    subject="Bonjour {first_name}",
+                    body="<p>{full_name}</p>",
+                    created_by=self.test_user.id
+                )
+                self.email_service.preview_email(template.id, page['contacts'][0]['id'])
+                wave = self.email_service.create_send_wave(
+                    campaign.id, WaveType.INITIAL, template.id, self.test_user.id,
+                    filter_criteria={'status': ContactStatus.PENDING.value}
+                )
+                self.email_service.get_wave_status(wave.id)
+                
+                # Requêtes du moteur d'envoi: outbox, écriture des résultats, reprise
+                saved = (self.email_service.provider, self.email_service.rate_limiter)
+                self.email_service.provider = LocalProvider()
+                self.email_service.rate_limiter = RateLimiter(rate=1000, per_seconds=1)
+                try:
+                    self.email_service.start_send_wave(wave.id)
+                    deadline = time.monotonic() + 30
+                    while time.monotonic() < deadline:
+                        if self.email_service.get_wave_status(wave.id)['status'] == WaveStatus.COMPLETED.value:
+                            break
+                        time.sleep(0.1)
+                    self.email_service.stop_processing()
+                    self.email_service.resume_send_waves()
+                finally:
+                    self.email_service.provider, self.email_service.rate_limiter = saved
+                    
+            # Chaque requête doit être servie par un index
+            full_scans = database.find_full_scans(queries)
+            for statement, steps in full_scans.items():
+                logger.error(f"  ❌ Parcours complet {steps}: {statement}")
+                
+            if full_scans:
+                self.results['query_plans'] = {
+                    'status': 'failed',
+                    'details': f"{len(full_scans)} requête(s) sur {len(queries)} sans index"
+                }
+                return False
+                
+            logger.info(f"  ✅ {len(queries)} requêtes servies par des index")
+            self.results['query_plans'] = {
+                'status': 'success',
+                'details': f"{len(queries)} requêtes vérifiées avec EXPLAIN QUERY PLAN"
+            }
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur lors du test des plans de requêtes: {e}")
+            traceback.print_exc()
+            self.results['query_plans'] = {'status': 'error', 'details': str(e)}
+            return False
+    
+    def test_send_results(self):
+        """Vérifier l'écriture groupée des résultats d'envoi"""
+        logger.info("📬 Test de l'écriture des résultats d'envoi...")
+        
+        try:
+            if not self.test_user:
+                logger.error("❌ Utilisateur de test non disponible")
+                return False
+                
+            from datetime import datetime, timedelta
+            from sqlmodel import select, func
+            from backend.database import session_scope, write_scope
+            from backend.models.contact import CampaignContact, ContactStatus
+            from backend.models.email import WaveType, SendOutbox, MailLog, MailStatus
+            from backend.services.email_service import EmailQueueItem, RetryScheduler, SendRecord, SendResultBuffer
+            
+            campaign = self.campaign_service.create_campaign(
+                title="Campagne résultats d'envoi",
+                owner_id=self.test_user.id
+            )
+            self.contact_service.bulk_add_contacts_to_campaign(
+                campaign.id, [{'email': f"envoi.{campaign.id}@example.com", 'first_name': 'Jean'}]
+            )
+            contact_id = self.contact_service.list_campaign_contacts(campaign.id, limit=1)['contacts'][0]['id']
+            template = self.email_service.create_template(
+                name="Template résultats d'envoi",
+                subject="Bonjour {first_name}",
+                body="<p>{full_name}</p>",
+                created_by=self.test_user.id
+            )
+            wave = self.email_service.create_send_wave(
+                campaign.id, WaveType.INITIAL, template.id, self.test_user.id
+            )
+            with write_scope() as session:
+                outbox = SendOutbox(wave_id=wave.id, contact_id=contact_id, attempt=0, not_before=datetime.utcnow())
+                session.add(outbox)
+                session.flush()
+                outbox_id = outbox.id
+                
+            # Deux tentatives en échec puis l'envoi réussi, dans le même lot
+            logger.info("  - Test d'un lot avec nouvel essai et résultat final du même email...")
+            retry_at = datetime.utcnow() + timedelta(seconds=30)
+            common = {
+                'wave_id': wave.id,
+                'campaign_id': campaign.id,
+                'contact_id': contact_id,
+                'template_id': template.id,
+                'outbox_id': outbox_id
+            }
+            buffer = SendResultBuffer(writer=self.email_service._write_send_records)
+            buffer.add(SendRecord(status=MailStatus.FAILED, retry_count=0, retry_at=retry_at, error_message="timeout", **common))
+            buffer.add(SendRecord(status=MailStatus.FAILED, retry_count=1, retry_at=retry_at, error_message="timeout", **common))
+            buffer.add(SendRecord(status=MailStatus.SENT, retry_count=2, **common))
+            written = buffer.flush()
+            
+            with session_scope() as session:
+                outbox_left = session.get(SendOutbox, outbox_id)
+                logs = session.exec(
+                    select(func.count()).select_from(MailLog).where(MailLog.wave_id == wave.id)
+                ).one()
+                status = session.get(CampaignContact, (campaign.id, contact_id)).status
+                
+            if written != 3 or outbox_left is not None or logs != 3 or status != ContactStatus.SENT:
+                logger.error(
+                    f"  ❌ Lot mal écrit: {written} écrits, outbox restante: {outbox_left is not None}, "
+                    f"{logs} logs, statut {status}"
+                )
+                self.results['send_results'] = {'status': 'failed', 'details': 'Lot de résultats non écrit'}
+                return False
+                
+            logger.info("  ✅ Lot écrit, email retiré de l'outbox")
+            
+            # Une erreur d'écriture autre qu'un doublon garde les résultats
+            logger.info("  - Test d'une erreur d'écriture passagère...")
+            def failing_writer(records, skip_existing):
+                raise RuntimeError("base indisponible")
+                
+            buffer = SendResultBuffer(writer=failing_writer)
+            buffer.add(SendRecord(status=MailStatus.SENT, retry_count=3, **common))
+            kept = buffer.flush() == 0 and len(buffer.records) == 1
+            buffer.writer = self.email_service._write_send_records
+            if not kept or buffer.flush() != 1:
+                logger.error("  ❌ Résultat perdu après une erreur d'écriture")
+                self.results['send_results'] = {'status': 'failed', 'details': 'Résultat perdu'}
+                return False
+                
+            logger.info("  ✅ Résultat gardé puis écrit")
+            
+            # Une exception du fournisseur est enregistrée comme tentative
+            logger.info("  - Test d'une exception du fournisseur...")
+            class FailingProvider:
+                def send_email(self, message):
+                    raise RuntimeError("Outlook indisponible")
+                    
+            saved = (self.email_service.provider, self.email_service.result_buffer, self.email_service.retry_scheduler)
+            self.email_service.provider = FailingProvider()
+            self.email_service.result_buffer = SendResultBuffer(writer=failing_writer)
+            self.email_service.retry_scheduler = RetryScheduler()
+            try:
+                self.email_service._send_single_email(EmailQueueItem(
+                    wave_id=wave.id,
+                    contact_id=contact_id,
+                    template_id=template.id,
+                    email_data={'email': f"envoi.{campaign.id}@example.com", 'first_name': 'Jean'},
+                    outbox_id=outbox_id
+                ))
+                recorded = self.email_service.result_buffer.records
+            finally:
+                self.email_service.provider, self.email_service.result_buffer, self.email_service.retry_scheduler = saved
+                
+            if len(recorded) != 1 or recorded[0].retry_at is None:
+                logger.error(f"  ❌ Exception du fournisseur non enregistrée: {len(recorded)} résultats")
+                self.results['send_results'] = {'status': 'failed', 'details': 'Exception du fournisseur perdue'}
+                return False
+                
+            logger.info("  ✅ Exception enregistrée, nouvel essai planifié")
+            self.results['send_results'] = {
+                'status': 'success',
+                'details': "Lot écrit, résultats gardés sur erreur, exceptions du fournisseur enregistrées"
+            }
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur lors du test des résultats d'envoi: {e}")
+            traceback.print_exc()
+            self.results['send_results'] = {'status': 'error', 'details': str(e)}
+            return False
+    
     def test_frontend_components(self):
         """Tester les composants frontend"""
         logger.info("🎨 Test des composants frontend...")
@@ -420,6 +659,8 @@ class FunctionalityTester:
             ('Gestion des contacts', self.test_contact_management),
             ('Templates email', self.test_email_templates),
             ('Audit logging', self.test_audit_logging),
+            ('Plans de requêtes', self.test_query_plans),
+            ('Résultats d\'envoi', self.test_send_results),
         ]
         
         passed = 0